@@ -17,21 +17,331 @@
 from grid import Grid
 import random
 from samples import *
-import copy
+import json
+import math
+import time
+from array import array
+from collections import deque
+from functools import wraps
+from multiprocessing import Pool, cpu_count
+
+#######
+####### Compact domain representation
+#######
+class DomainStore:
+    """ Compact domain store shared by every solver.
+    Each cell keeps its remaining values as one small int bitmask
+    held in an array, bit i standing for the i-th digit of the puzzle
+    alphabet. Cells are addressed by their position in self.cells.
+
+    Removals are done in place and recorded on an undo trail, so a
+    search can roll the domains back with undo() when it backtracks
+    instead of copying them at each node.
+
+    The store also behaves like the read-only dictionary returned by
+    grid.getDomainValues() ({cell: ['1', '2', ...]}), so the heuristic
+    functions can be given a store in place of the dictionary.
+
+    A watcher (see MRVIndex) can be attached with watch(): it is told
+    about every domain change and every (un)assignment of a cell.
+
+    When the grid is given, self.peers holds the positions of the
+    related cells of each position (see peerTable())."""
+
+    def __init__( self, domains, grid = None ):
+        """ @param domains the dictionary returned by grid.getDomainValues().
+        @param grid the current puzzle grid, used to get the peer table."""
+        self.cells = sorted(domains.keys())
+        self.position = dict((cell, i) for i, cell in enumerate(self.cells))
+        self.peers = peerTable(self.cells, grid) if grid is not None else None
+        # The alphabet follows the order of the largest domain (the full
+        # domain of an empty cell), so that values are decoded, and tried
+        # by the solvers, in the order given by the grid.
+        self.alphabet = list(max([domains[cell] for cell in self.cells] or [[]], key = len))
+        for value in sorted(set(value for cell in self.cells for value in domains[cell])):
+            if value not in self.alphabet:
+                self.alphabet.append(value)
+        self.bit = dict((value, 1 << i) for i, value in enumerate(self.alphabet))
+        self.popcount = popcountTable(len(self.alphabet))
+        self.masks = array('L', [self.encode(domains[cell]) for cell in self.cells])
+        self.trail = []
+        self.watcher = None
+
+    def watch( self, watcher ):
+        """ Attaches a watcher providing resized(i), assign(i) and unassign(i)."""
+        self.watcher = watcher
+
+    def assign( self, cell ):
+        """ Tells the watcher that the search assigned cell."""
+        if self.watcher is not None:
+            self.watcher.assign(self.position[cell])
+
+    def unassign( self, cell ):
+        """ Tells the watcher that the search freed cell."""
+        if self.watcher is not None:
+            self.watcher.unassign(self.position[cell])
+
+    def encode( self, values ):
+        """ Returns the bitmask of a list of values."""
+        mask = 0
+        for value in values:
+            mask |= self.bit[value]
+        return mask
+
+    def decode( self, mask ):
+        """ Returns the list of values of a bitmask, in alphabet order."""
+        return [value for value in self.alphabet if mask & self.bit[value]]
+
+    def size( self, i ):
+        """ Returns the number of values left in the domain of the i-th cell."""
+        return self.popcount[self.masks[i]]
+
+    def remove( self, i, value ):
+        """ Removes a value from the domain of the i-th cell in constant time
+        and records the previous bitmask on the trail.
+        Returns the remaining bitmask."""
+        old = self.masks[i]
+        mask = old & ~self.bit[value]
+        self.masks[i] = mask
+        self.trail.append((i, old))
+        if self.watcher is not None:
+            self.watcher.resized(i)
+        return mask
+
+    def restrict( self, i, mask ):
+        """ Keeps only the values of mask in the domain of the i-th cell
+        and records the previous bitmask on the trail, unless nothing is
+        removed. Returns the remaining bitmask."""
+        old = self.masks[i]
+        mask &= old
+        if mask == old:
+            return mask
+        self.masks[i] = mask
+        self.trail.append((i, old))
+        if self.watcher is not None:
+            self.watcher.resized(i)
+        return mask
+
+    def mark( self ):
+        """ Returns the current position of the trail."""
+        return len(self.trail)
+
+    def removedSince( self, mark ):
+        """ Returns the number of values removed since the trail was at mark."""
+        masks, popcount = self.masks, self.popcount
+        after = {}
+        removed = 0
+        for i, old in reversed(self.trail[mark:]):
+            removed += popcount[old] - popcount[after.get(i, masks[i])]
+            after[i] = old
+        return removed
+
+    def undo( self, mark ):
+        """ Restores every domain changed since the trail was at mark."""
+        masks, trail, watcher = self.masks, self.trail, self.watcher
+        while len(trail) > mark:
+            i, mask = trail.pop()
+            masks[i] = mask
+            if watcher is not None:
+                watcher.resized(i)
+
+    def toDict( self ):
+        """ Returns the domains as a grid.getDomainValues() dictionary."""
+        return dict((cell, self.decode(self.masks[i])) for i, cell in enumerate(self.cells))
+
+    # Read-only dictionary interface used by the heuristic functions.
+    def __getitem__( self, cell ):
+        return self.decode(self.masks[self.position[cell]])
+
+    def __contains__( self, cell ):
+        return cell in self.position
+
+    def __len__( self ):
+        return len(self.cells)
+
+    def __iter__( self ):
+        return iter(self.cells)
+
+    def keys( self ):
+        return list(self.cells)
+
+    def iteritems( self ):
+        for i, cell in enumerate(self.cells):
+            yield cell, self.decode(self.masks[i])
+
+    def items( self ):
+        return list(self.iteritems())
+
+_popcountTables = {}
+
+def popcountTable( nbValues ):
+    """ Returns the table of the number of bits set for every
+    bitmask of nbValues bits. Tables are shared between stores."""
+    if nbValues > 16:
+        return _PopcountFunction()
+    if nbValues not in _popcountTables:
+        table = array('B', [0]) * (1 << nbValues)
+        for mask in xrange(1, 1 << nbValues):
+            table[mask] = table[mask >> 1] + (mask & 1)
+        _popcountTables[nbValues] = table
+    return _popcountTables[nbValues]
+
+_peerTables = {}
+
+def peerTable( cells, grid ):
+    """ Returns, for the i-th cell of cells, the tuple of the positions of
+    its related cells in cells. grid.getRelatedCells() only depends on the
+    geometry of the grid, so the table is computed once and shared by all
+    the puzzles with the same cells."""
+    key = tuple(cells)
+    if key not in _peerTables:
+        position = dict((cell, i) for i, cell in enumerate(cells))
+        _peerTables[key] = tuple(tuple(position[related] for related in grid.getRelatedCells(cell))
+                                 for cell in cells)
+    return _peerTables[key]
+
+_unitTables = {}
+
+def gridUnits( domains ):
+    """ Returns the units of the grid as lists of positions in the store:
+    the rows, columns and boxes when the peer table of the store matches a
+    square Sudoku layout in row-major order, otherwise one unit for each
+    pair of related cells. Two cells are related iff they share a unit.
+    Like the peer table, the units are shared by puzzles of the same grid."""
+    if domains.peers not in _unitTables:
+        _unitTables[domains.peers] = findUnits(domains.peers)
+    return _unitTables[domains.peers]
+
+def findUnits( peerTable ):
+    size = len(peerTable)
+    side = int(round(size ** 0.5))
+    box = int(round(side ** 0.5))
+    related = [set(peers) for peers in peerTable]
+    if side * side == size and box * box == side:
+        units = [range(r * side, (r + 1) * side) for r in range(side)]
+        units += [range(c, size, side) for c in range(side)]
+        units += [[(r + i) * side + c + j for i in range(box) for j in range(box)]
+                  for r in range(0, side, box) for c in range(0, side, box)]
+        peers = [set() for i in range(size)]
+        for unit in units:
+            for i in unit:
+                peers[i].update(unit)
+        if all(peers[i] - set([i]) == related[i] for i in range(size)):
+            return units
+    return [[i, j] for i in range(size) for j in related[i] if i < j]
+
+class _PopcountFunction:
+    """ Counts the bits on demand for alphabets too large for a table."""
+    def __getitem__( self, mask ):
+        return bin(mask).count('1')
+
+#######
+####### Solver instrumentation
+#######
+class SolverStats:
+    """ Counters of one solve: nodes expanded, backtracks, domain
+    wipeouts, values removed by propagation and wall time (seconds)."""
+    FIELDS = ['nodes', 'backtracks', 'wipeouts', 'removals', 'time']
+
+    def __init__( self ):
+        self.reset()
+
+    def reset( self ):
+        self.nodes = 0
+        self.backtracks = 0
+        self.wipeouts = 0
+        self.removals = 0
+        self.time = 0.0
+        self.start = time.time()
+
+    def elapsed( self ):
+        return time.time() - self.start
+
+    def asDict( self ):
+        return dict((field, getattr(self, field)) for field in self.FIELDS)
+
+class JSONLinesRecorder:
+    """ Record sink writing each record as one JSON line in a file."""
+    def __init__( self, stream ):
+        """ @param stream a file opened for writing."""
+        self.stream = stream
+
+    def __call__( self, record ):
+        self.stream.write(json.dumps(record, sort_keys = True) + '\n')
+
+def instrumented( solve ):
+    """ Decorator for the solve() methods of the agents: resets the
+    statistics of the agent, measures the wall time of the solve and
+    emits a 'solve' record. Nested solves are counted in the outer one."""
+    @wraps(solve)
+    def instrumentedSolve( self, *args, **kwargs ):
+        self.solving += 1
+        if self.solving == 1:
+            self.stats.reset()
+        try:
+            solution = solve(self, *args, **kwargs)
+        finally:
+            self.solving -= 1
+        if self.solving == 0:
+            self.stats.time = self.stats.elapsed()
+            self.emit('solve', solved = solution is not None)
+        return solution
+    return instrumentedSolve
 
 class Agent:
     """
     Abstract class for the solvers that implements the
-    Strategy design pattern.
-    YOU DO NOT NEED TO CHANGE ANYTHING IN THIS CLASS, EVER.
+    Strategy design pattern. The solvers count their nodes with
+    incrementCount() and their propagations with countPropagation(),
+    and their solve() is wrapped by @instrumented.
+
+    The counters of the last solve are available from getStats(). Records
+    (dictionaries) are given to the recorder, if any: one at the end of
+    each solve and, if sampleEvery is set, one every sampleEvery nodes.
+    The spinner is only displayed on request.
     """
-    def __init__( self ):
+    def __init__( self, spinner = False, recorder = None, sampleEvery = 0 ):
+        """ @param spinner display the spinner at each node.
+        @param recorder a callable receiving the records, eg. a JSONLinesRecorder.
+        @param sampleEvery number of nodes between two 'progress' records, 0 for none."""
         self.count = 0;
         self.clock = ['|', '/', '-', '\\']
+        self.spinner = spinner
+        self.recorder = recorder
+        self.sampleEvery = sampleEvery
+        self.stats = SolverStats()
+        self.solving = 0
 
     def incrementCount( self):
         self.count += 1;
-        self.displayTime()
+        self.stats.nodes += 1
+        if self.spinner:
+            self.displayTime()
+        if self.sampleEvery and self.stats.nodes % self.sampleEvery == 0:
+            self.emit('progress', elapsed = self.stats.elapsed())
+
+    def countPropagation( self, domains, mark, consistent ):
+        """ Adds the values removed from domains since the trail was at mark,
+        and a wipeout if the propagation failed, to the statistics.
+        Returns consistent."""
+        self.stats.removals += domains.removedSince(mark)
+        if not consistent:
+            self.stats.wipeouts += 1
+        return consistent
+
+    def getStats( self ):
+        """ Returns the counters of the last (or current) solve as a dictionary."""
+        return self.stats.asDict()
+
+    def emit( self, event, **fields ):
+        """ Gives a record of the current statistics to the recorder."""
+        if self.recorder is None:
+            return
+        record = self.getStats()
+        record.update(fields)
+        record['event'] = event
+        record['agent'] = self.__class__.__name__
+        self.recorder(record)
         
     def displayTime( self ):
         print "\b\b\b" + self.clock[self.count % 4], 
@@ -47,47 +357,104 @@ class BS( Agent ):
     """ Backtracking version of the solver based on simple
     uninformed backtracking search: recursive depth-first search."""
     
-    def solve( self, grid ):
+    @instrumented
+    def solve( self, grid, heuristicFunction = None, incremental = False ):
         """ Returns a solution as a dictionary of assignment
         eg: {0:'2', 1:'3', ..., 40:'5'}
         or None if no solution is found.
-        @param grid a reference to the current puzzle grid."""
-        domains = grid.getDomainValues()
-        return self.__recursiveBacktracking(grid, domains, {})
+        @param grid a reference to the current puzzle grid.
+        @param heuristicFunction ignored, the cells are assigned in grid
+        order; taken so that BS is called like the other solvers.
+        @param incremental check each assignment against the values already
+        used in its units instead of checking complete assignments only."""
+        domains = DomainStore(grid.getDomainValues(), grid)
+        if incremental:
+            units = gridUnits(domains)
+            self.unitsOf = [[] for cell in domains.cells]
+            for u, unit in enumerate(units):
+                for i in unit:
+                    self.unitsOf[i].append(u)
+            self.used = array('L', [0]) * len(units)
+            # The given cells come first, so that their values are
+            # already used when the free cells are tried.
+            self.order = sorted(range(len(domains)), key = lambda i: domains.size(i) != 1)
+            return self.__incrementalBacktracking(domains, 0, {})
+        return self.__recursiveBacktracking(grid, domains, 0, {})
 
-    def __recursiveBacktracking( self, grid, domains, assignment ):
-        """ Implements a recursive search.
+    def __recursiveBacktracking( self, grid, domains, i, assignment ):
+        """ Implements a recursive search on the i-th cell of the store.
+        The domains are never modified, so they are shared by every level
+        and the assignment is extended and restored in place.
         Returns the solution as list or None. """
         self.incrementCount()
-        if len(domains) == 0: # All cells set
-            if self.__isGoal(grid, assignment):
+        if i == len(domains): # All cells set
+            if self.__isGoal(domains, assignment):
                 return assignment
             return None
 
-        variable, values =  domains.popitem()
-        newAssignment = copy.deepcopy(assignment)
-        for value in values:
-            # Use a deep copy of domains to avoid backtracking issues.
-            newAssignment[variable] = value
-            solution = self.__recursiveBacktracking(grid, copy.deepcopy(domains), newAssignment)
+        variable = domains.cells[i]
+        for value in domains.decode(domains.masks[i]):
+            assignment[variable] = value
+            solution = self.__recursiveBacktracking(grid, domains, i + 1, assignment)
             if solution:
                 return solution
+            self.stats.backtracks += 1
+        del assignment[variable]
         return None
 
-    def __isGoal( self, grid, assignment ):
+    def __incrementalBacktracking( self, domains, i, assignment ):
+        """ Same search as __recursiveBacktracking() over the cells in
+        self.order, but a value is only tried if it is not already used in
+        one of the units of the cell, so every complete assignment is a
+        solution.
+        self.used holds the bitmask of the values used in each unit."""
+        self.incrementCount()
+        if i == len(domains): # All cells set
+            return assignment
+
+        position = self.order[i]
+        variable = domains.cells[position]
+        units, used = self.unitsOf[position], self.used
+        for value in domains.decode(domains.masks[position]):
+            bit = domains.bit[value]
+            if any(used[u] & bit for u in units):
+                continue
+            for u in units:
+                used[u] |= bit
+            assignment[variable] = value
+            solution = self.__incrementalBacktracking(domains, i + 1, assignment)
+            if solution:
+                return solution
+            self.stats.backtracks += 1
+            for u in units:
+                used[u] &= ~bit
+        assignment.pop(variable, None)
+        return None
+
+    def __isGoal( self, domains, assignment ):
         """ Tests if the assignment is a solution.
         ie. that there is not doubles in each boxes, lines and columns.
+        @param domains the DomainStore holding the peer table.
         @param assignment a dictionary with the current assignment.
         """
-        for variable, value in assignment.iteritems():
-            for cell in grid.getRelatedCells(variable):
-                if assignment[variable] == assignment[cell]:
+        cells = domains.cells
+        for i, peers in enumerate(domains.peers):
+            value = assignment[cells[i]]
+            for j in peers:
+                if value == assignment[cells[j]]:
                     return False
         return True
 
+class IncrementalBS( BS ):
+    """ BS in its incremental mode, under a name of its own so that the
+    batch solver and the benchmark can run it."""
+
+    def solve( self, grid, heuristicFunction = None ):
+        return BS.solve(self, grid, heuristicFunction, incremental = True)
+
 def defaultHeuristic( domains, assignment, grid ):
     """ Picks the first free variable."""
-    for cell, p in domains.iteritems():
+    for cell in domains:
         if cell not in assignment:
             return cell
                                
@@ -100,6 +467,7 @@ def defaultHeuristic( domains, assignment, grid ):
 # |______/_/\_\___|_|  \___|_|___/\___|  |_|
 
 class FC( Agent ):
+    @instrumented
     def solve( self, grid, heuristicFunction = defaultHeuristic ):
         """ Forward Checking.
 
@@ -108,30 +476,39 @@ class FC( Agent ):
         @param grid the current puzzle grid.
         @param heuristicFunction the function used to choose the next cell to considered.
         """
-        return self.recursiveSearch({}, grid.getDomainValues(), grid, heuristicFunction)
+        return self.recursiveSearch({}, DomainStore(grid.getDomainValues(), grid), grid, heuristicFunction)
         
     def recursiveSearch(self, assignment, domains, grid, heuristicFunction):
+        """ The domains are changed in place by forwardChecking() and
+        rolled back from the trail of the store when a value fails."""
         self.incrementCount()
-        if domains.keys() == assignment.keys():
-            if all(domains[key] for key in assignment.keys()):
-                return assignment
+        if len(assignment) == len(domains):
+            return assignment
         current = heuristicFunction(domains, assignment, grid)
+        domains.assign(current)
         for value in domains[current]:
             assignment[current] = value
-            domains1 = self.forwardChecking(current, value, copy.deepcopy(domains), grid)
-            if domains1 != None:
-                result = self.recursiveSearch(assignment, domains1, grid, heuristicFunction)
+            mark = domains.mark()
+            consistent = self.forwardChecking(current, value, domains, grid) != None
+            if self.countPropagation(domains, mark, consistent):
+                result = self.recursiveSearch(assignment, domains, grid, heuristicFunction)
                 if result != None:
                     return assignment
+            domains.undo(mark)
+            self.stats.backtracks += 1
             del assignment[current]
+        domains.unassign(current)
         return None
     
     def forwardChecking(self, var, value, domain, grid):
-        list_of_dependencies = grid.getRelatedCells(var)
-        for dep in list_of_dependencies:
-            if value in domain[dep]:
-                domain[dep].remove(value)
-                if not domain[dep]:
+        """ Removes value from the domains of the cells related to var.
+        Returns the store, or None as soon as a domain is wiped out
+        (the removals done so far stay on the trail)."""
+        bit = domain.bit[value]
+        masks = domain.masks
+        for i in domain.peers[domain.position[var]]:
+            if masks[i] & bit:
+                if not domain.remove(i, value):
                     return None
         return domain
 
@@ -143,11 +520,102 @@ class FC( Agent ):
 # |______/_/\_\___|_|  \___|_|___/\___| |____|
  
 def myHeuristic(domains, assignment, grid):
-    """ The best heuristic """
+    """ The best heuristic: a free cell with less than 3 values left,
+    or the first free cell if there is none."""
     for cell, p in domains.iteritems():
         if cell not in assignment:
             if len(p) < 3:
                 return cell
+    return defaultHeuristic(domains, assignment, grid)
+
+class MRVIndex:
+    """ Variable selection index for the minimum remaining values
+    heuristic with degree tie-breaking.
+
+    The free cells are kept in buckets keyed by their domain size, then
+    by their number of free related cells (largest first). The store
+    tells the index about every change, so a cell only moves between
+    two buckets on a removal, and select() returns the first cell of the
+    lowest non-empty bucket in amortized constant time."""
+
+    def __init__( self, domains, assignment ):
+        """ @param domains the DomainStore of the search.
+        @param assignment the current assignment."""
+        self.domains = domains
+        self.peers = domains.peers
+        self.maxDegree = max([len(peers) for peers in self.peers] + [0])
+        self.buckets = [set() for k in range((len(domains.alphabet) + 1) * (self.maxDegree + 1))]
+        self.free = [cell not in assignment for cell in domains.cells]
+        self.degree = [sum(1 for j in peers if self.free[j]) for peers in self.peers]
+        self.key = [-1] * len(domains.cells)
+        self.lowest = 0
+        for i in range(len(domains.cells)):
+            if self.free[i]:
+                self.place(i)
+
+    def place( self, i ):
+        """ Moves the i-th cell to the bucket of its current size and degree."""
+        key = self.domains.size(i) * (self.maxDegree + 1) + self.maxDegree - self.degree[i]
+        if key != self.key[i]:
+            if self.key[i] >= 0:
+                self.buckets[self.key[i]].discard(i)
+            self.buckets[key].add(i)
+            self.key[i] = key
+            if key < self.lowest:
+                self.lowest = key
+
+    def resized( self, i ):
+        if self.free[i]:
+            self.place(i)
+
+    def assign( self, i ):
+        if not self.free[i]:
+            return
+        self.free[i] = False
+        self.buckets[self.key[i]].discard(i)
+        self.key[i] = -1
+        for j in self.peers[i]:
+            self.degree[j] -= 1
+            if self.free[j]:
+                self.place(j)
+
+    def unassign( self, i ):
+        if self.free[i]:
+            return
+        self.free[i] = True
+        for j in self.peers[i]:
+            self.degree[j] += 1
+            if self.free[j]:
+                self.place(j)
+        self.place(i)
+
+    def select( self ):
+        """ Returns the free cell with the fewest values left and the most
+        free related cells, or None if every cell is assigned."""
+        buckets = self.buckets
+        while self.lowest < len(buckets):
+            if buckets[self.lowest]:
+                return self.domains.cells[next(iter(buckets[self.lowest]))]
+            self.lowest += 1
+        return None
+
+def mrvHeuristic(domains, assignment, grid):
+    """ Minimum remaining values, ties broken by the largest number of
+    free related cells. With a DomainStore the cell comes from an
+    MRVIndex attached to the store on the first call; with a plain
+    dictionary of domains every free cell is scanned."""
+    if isinstance(domains, DomainStore):
+        if not isinstance(domains.watcher, MRVIndex):
+            domains.watch(MRVIndex(domains, assignment))
+        return domains.watcher.select()
+    best, bestKey = None, None
+    for cell, p in domains.iteritems():
+        if cell not in assignment:
+            degree = sum(1 for related in grid.getRelatedCells(cell) if related not in assignment)
+            key = (len(p), -degree)
+            if bestKey is None or key < bestKey:
+                best, bestKey = cell, key
+    return best
 
 #  ______                   _            ____  
 # |  ____|                 (_)          |___ \ 
@@ -156,17 +624,94 @@ def myHeuristic(domains, assignment, grid):
 # | |____ >  <  __/ | | (__| \__ \  __/  ___) |
 # |______/_/\_\___|_| \___|_|___/\___| |____/ 
 
+class ArcConsistency:
+    """ Arc consistency propagator (AC-3 with residual supports) for the
+    difference constraints between related cells.
+
+    The arcs are built once from the peer table of the store. For each arc
+    (x, y) and each value a of x, the last support found for a in the
+    domain of y is kept as a residue: revising the arc only looks for a
+    new support when the residue has been removed. Residues are hints,
+    so they stay valid when the store is rolled back."""
+
+    def __init__( self, domains ):
+        """ @param domains the DomainStore of the puzzle."""
+        self.arcs = []
+        self.arcsTo = [[] for cell in domains.cells]
+        for x, peers in enumerate(domains.peers):
+            for y in peers:
+                self.arcsTo[y].append(len(self.arcs))
+                self.arcs.append((x, y))
+        self.nbValues = len(domains.alphabet)
+        self.valueIndex = dict((1 << i, i) for i in range(self.nbValues))
+        self.residues = array('L', [0]) * (len(self.arcs) * self.nbValues)
+
+    def establish( self, domains ):
+        """ Makes every arc consistent.
+        Returns False if a domain is wiped out."""
+        return self.propagate(domains, range(len(self.arcs)))
+
+    def propagate( self, domains, arcs ):
+        """ Revises the given arcs, and the arcs of every domain reduced
+        on the way, until the queue is empty. Removals are recorded on
+        the trail of the store.
+        Returns False if a domain is wiped out."""
+        queue = deque(arcs)
+        queued = bytearray(len(self.arcs))
+        for arc in arcs:
+            queued[arc] = 1
+        while queue:
+            arc = queue.popleft()
+            queued[arc] = 0
+            x = self.arcs[arc][0]
+            mask = self.revise(domains, arc)
+            if mask is None:
+                continue
+            if not mask:
+                return False
+            for other in self.arcsTo[x]:
+                if not queued[other]:
+                    queued[other] = 1
+                    queue.append(other)
+        return True
+
+    def revise( self, domains, arc ):
+        """ Removes the values of x without support in y for arc (x, y).
+        Returns the new bitmask of x, or None if nothing was removed."""
+        x, y = self.arcs[arc]
+        masks, residues = domains.masks, self.residues
+        target = masks[y]
+        base = arc * self.nbValues
+        removed = 0
+        values = masks[x]
+        while values:
+            value = values & -values
+            values ^= value
+            k = base + self.valueIndex[value]
+            if residues[k] & target:
+                continue
+            support = target & ~value
+            if support:
+                residues[k] = support & -support
+            else:
+                removed |= value
+        if not removed:
+            return None
+        return domains.restrict(x, ~removed)
+
 class AC3( Agent ):
+    @instrumented
     def solve( self, grid, heuristicFunction = defaultHeuristic ):
         """ Arc Consistency as preprocessing.
         Returns the domain of values after applying
-        the arc consistency technique.
+        the arc consistency technique, or None if a domain is wiped out.
 
         @param grid the current puzzle grid.
         @param heuristicFunction the function is used to choose the next cell to considered."""
-
-        "*** YOUR CODE HERE ***"
-        raise Exception, "Method not implemented: solve()"
+        domains = DomainStore(grid.getDomainValues(), grid)
+        if not self.countPropagation(domains, 0, ArcConsistency(domains).establish(domains)):
+            return None
+        return domains.toDict()
 
 #  ______                   _            _  _   
 # |  ____|                 (_)          | || |  
@@ -175,7 +720,8 @@ class AC3( Agent ):
 # | |____ >  <  __/ | | (__| \__ \  __/    | |  
 # |______/_/\_\___|_|  \___|_|___/\___|    |_|  
 
-class AC_FC( Agent ):
+class AC_FC( FC ):
+    @instrumented
     def solve( self, grid, heuristicFunction = defaultHeuristic ):
         """ Forward Checking with Arc Consistency as preprocessing.
         Returns a solution as a dictionary of assignment, eg: {0:'2', 1:'3', ...40:'5'}
@@ -183,9 +729,10 @@ class AC_FC( Agent ):
 
         @param grid the current puzzle grid.
         @param heuristicFunction the function used to choose the next cell to considered."""
-
-        "*** YOUR CODE HERE ***"
-        raise Exception, "Method not implemented: solve()"
+        domains = DomainStore(grid.getDomainValues(), grid)
+        if not self.countPropagation(domains, 0, ArcConsistency(domains).establish(domains)):
+            return None
+        return self.recursiveSearch({}, domains, grid, heuristicFunction)
 
 #  ______                   _            _____ 
 # |  ____|                 (_)          | ____|
@@ -194,13 +741,395 @@ class AC_FC( Agent ):
 # | |____ >  <  __/ | | (__| \__ \  __/  ___) |
 # |______/_/\_\___|_|  \___|_|___/\___| |____/ 
                                               
-class AC_AC( Agent ):
+class AC_AC( FC ):
+    @instrumented
     def solve( self, grid, heuristicFunction = defaultHeuristic ):
         """ Maintaining Arc Consistency.
-        Returns a solution as a list of assignment, eg: ['2', '3', ...'5']
-        for each cell of the grid.
+        Returns a solution as a dictionary of assignment, eg: {0:'2', 1:'3', ...40:'5'}
+        or None if no solution is found.
         @param grid the current puzzle grid.
         @param heuristicFunction the function used to choose the next cell to considered."""
+        domains = DomainStore(grid.getDomainValues(), grid)
+        self.arcConsistency = ArcConsistency(domains)
+        if not self.countPropagation(domains, 0, self.arcConsistency.establish(domains)):
+            return None
+        return self.recursiveSearch({}, domains, grid, heuristicFunction)
+
+    def forwardChecking(self, var, value, domain, grid):
+        """ Reduces the domain of var to value and restores arc consistency
+        from the arcs pointing to var.
+        Returns the store, or None if a domain is wiped out."""
+        i = domain.position[var]
+        domain.restrict(i, domain.bit[value])
+        if not self.arcConsistency.propagate(domain, self.arcConsistency.arcsTo[i]):
+            return None
+        return domain
+
+#######
+####### Exact cover solver
+#######
+class DLX( Agent ):
+    """ Exact cover solver: Knuth's Algorithm X with dancing links.
+
+    Each row of the matrix places a value in a cell. It covers the
+    column of the cell and, for each unit of the cell, the column of the
+    value in that unit. The columns of the units holding as many cells
+    as values are primary (covered exactly once), the others are
+    secondary (covered at most once), so any layout given by gridUnits()
+    works. The matrix is a set of doubly linked lists held in arrays,
+    covered and uncovered in place during the search."""
+
+    @instrumented
+    def solve( self, grid ):
+        """ Returns a solution as a dictionary of assignment, eg: {0:'2', 1:'3', ...40:'5'}
+        or None if no solution is found.
+        @param grid the current puzzle grid."""
+        domains = DomainStore(grid.getDomainValues(), grid)
+        self.build(domains)
+        rows = []
+        if not self.search(rows):
+            return None
+        assignment = {}
+        for node in rows:
+            i, value = self.rowOf[node]
+            assignment[domains.cells[i]] = value
+        return assignment
+
+    def build( self, domains ):
+        """ Builds the exact cover matrix of the puzzle.
+        Node 0 is the root, nodes 1 to the number of columns are the column
+        headers, then come the nodes of the rows."""
+        units = gridUnits(domains)
+        nbCells, nbValues = len(domains.cells), len(domains.alphabet)
+        unitsOf = [[] for i in range(nbCells)]
+        for u, unit in enumerate(units):
+            for i in unit:
+                unitsOf[i].append(u)
+        nbColumns = nbCells + len(units) * nbValues
+        self.L, self.R = range(nbColumns + 1), range(nbColumns + 1)
+        self.U, self.D = range(nbColumns + 1), range(nbColumns + 1)
+        self.C = range(nbColumns + 1)
+        self.S = [0] * (nbColumns + 1)
+        self.rowOf = [None] * (nbColumns + 1)
+        L, R = self.L, self.R
+        primary = range(1, nbCells + 1)
+        for u, unit in enumerate(units):
+            if len(unit) == nbValues:
+                primary.extend(range(1 + nbCells + u * nbValues, 1 + nbCells + (u + 1) * nbValues))
+        previous = 0
+        for column in primary:
+            R[previous], L[column] = column, previous
+            previous = column
+        R[previous], L[0] = 0, previous
+        for i in range(nbCells):
+            for k, value in enumerate(domains.alphabet):
+                if domains.masks[i] & (1 << k):
+                    columns = [1 + i] + [1 + nbCells + u * nbValues + k for u in unitsOf[i]]
+                    self.addRow(columns, (i, value))
+
+    def addRow( self, columns, row ):
+        L, R, U, D, C = self.L, self.R, self.U, self.D, self.C
+        first = len(L)
+        for column in columns:
+            node = len(L)
+            L.append(node - 1)
+            R.append(node + 1)
+            U.append(U[column])
+            D.append(column)
+            C.append(column)
+            D[U[column]] = node
+            U[column] = node
+            self.S[column] += 1
+            self.rowOf.append(row)
+        L[first], R[-1] = len(L) - 1, first
+
+    def cover( self, column ):
+        L, R, U, D, C, S = self.L, self.R, self.U, self.D, self.C, self.S
+        L[R[column]], R[L[column]] = L[column], R[column]
+        i = D[column]
+        while i != column:
+            j = R[i]
+            while j != i:
+                U[D[j]], D[U[j]] = U[j], D[j]
+                S[C[j]] -= 1
+                j = R[j]
+            i = D[i]
+
+    def uncover( self, column ):
+        L, R, U, D, C, S = self.L, self.R, self.U, self.D, self.C, self.S
+        i = U[column]
+        while i != column:
+            j = L[i]
+            while j != i:
+                S[C[j]] += 1
+                U[D[j]], D[U[j]] = j, j
+                j = L[j]
+            i = U[i]
+        L[R[column]], R[L[column]] = column, column
+
+    def search( self, rows ):
+        """ Algorithm X: covers the primary column with the fewest rows and
+        tries each of its rows. The chosen rows are appended to rows.
+        Returns True if every primary column is covered."""
+        self.incrementCount()
+        R, D, L, C, S = self.R, self.D, self.L, self.C, self.S
+        if R[0] == 0:
+            return True
+        column, size = 0, None
+        j = R[0]
+        while j != 0:
+            if size is None or S[j] < size:
+                column, size = j, S[j]
+                if size <= 1:
+                    break
+            j = R[j]
+        if size == 0:
+            self.stats.wipeouts += 1
+            return False
+        self.cover(column)
+        row = D[column]
+        while row != column:
+            rows.append(row)
+            j = R[row]
+            while j != row:
+                self.cover(C[j])
+                j = R[j]
+            if self.search(rows):
+                return True
+            j = L[row]
+            while j != row:
+                self.uncover(C[j])
+                j = L[j]
+            rows.pop()
+            self.stats.backtracks += 1
+            row = D[row]
+        self.uncover(column)
+        return False
+
+#######
+####### Forward Checking with Conflict-directed BackJumping
+#######
+class FC_CBJ( FC ):
+    """ Forward checking with conflict-directed backjumping (FC-CBJ).
+
+    self.culprits[j] holds, as a bitmask of search depths, the assignments
+    whose forward checking removed values from the j-th cell. When a
+    domain is wiped out, its culprits join the conflict set of the current
+    cell; when every value of a cell fails, the search jumps straight back
+    to the deepest assignment of its conflict set.
+
+    With learning, the conflict set of each dead end is also kept as a
+    nogood (a set of (position, value) that cannot be extended), indexed by
+    each of its pairs, and an assignment completing a nogood is refused.
+    Only short nogoods are kept: long ones are seldom met again and make
+    every check slower."""
+
+    @instrumented
+    def solve( self, grid, heuristicFunction = defaultHeuristic, learning = False,
+               maxNogoods = 100000, maxNogoodSize = 12 ):
+        """ Returns a solution as a dictionary of assignment, eg: {0:'2', 1:'3', ...40:'5'}
+        or None if no solution is found.
+        @param grid the current puzzle grid.
+        @param heuristicFunction the function used to choose the next cell to considered.
+        @param learning keep the nogoods learned at dead ends.
+        @param maxNogoods the maximum number of nogoods kept.
+        @param maxNogoodSize the maximum number of assignments of a kept nogood."""
+        domains = DomainStore(grid.getDomainValues(), grid)
+        self.culprits = [0] * len(domains)
+        self.stack = []
+        self.learning = learning
+        self.maxNogoods = maxNogoods
+        self.maxNogoodSize = maxNogoodSize
+        self.nogoods = {}
+        self.nbNogoods = 0
+        solution, conflict = self.backjumpingSearch({}, domains, grid, heuristicFunction)
+        return solution
+
+    def backjumpingSearch( self, assignment, domains, grid, heuristicFunction ):
+        """ Returns (assignment, 0) for a solution, or (None, conflict set)
+        where the conflict set is a bitmask of the depths to jump back to."""
+        self.incrementCount()
+        if len(assignment) == len(domains):
+            return assignment, 0
+        depth = len(self.stack)
+        depthBit = 1 << depth
+        current = heuristicFunction(domains, assignment, grid)
+        i = domains.position[current]
+        domains.assign(current)
+        conflict = self.culprits[i]
+        for value in domains[current]:
+            assignment[current] = value
+            self.stack.append((i, value))
+            mark = domains.mark()
+            refused = self.refusedBy(i, value, assignment, domains)
+            if refused is not None:
+                conflict |= refused
+            else:
+                wipedOut = self.forwardCheckingCBJ(i, value, domains, depthBit)
+                self.countPropagation(domains, mark, wipedOut is None)
+                if wipedOut is not None:
+                    conflict |= wipedOut & ~depthBit
+                else:
+                    solution, childConflict = self.backjumpingSearch(assignment, domains, grid, heuristicFunction)
+                    if solution is not None:
+                        return solution, 0
+                    if not childConflict & depthBit:
+                        # The current cell is not involved: jump over it.
+                        self.retract(i, current, assignment, domains, mark, depthBit)
+                        domains.unassign(current)
+                        return None, childConflict
+                    conflict |= childConflict & ~depthBit
+            self.retract(i, current, assignment, domains, mark, depthBit)
+            self.stats.backtracks += 1
+        domains.unassign(current)
+        self.learn(conflict)
+        return None, conflict
+
+    def forwardCheckingCBJ( self, i, value, domains, depthBit ):
+        """ Forward checking of the i-th cell, recording the current depth as
+        a culprit of every reduced domain.
+        Returns None, or the culprits of the cell that was wiped out."""
+        bit = domains.bit[value]
+        masks, culprits = domains.masks, self.culprits
+        for j in domains.peers[i]:
+            if masks[j] & bit:
+                culprits[j] |= depthBit
+                if not domains.remove(j, value):
+                    return culprits[j]
+        return None
+
+    def retract( self, i, current, assignment, domains, mark, depthBit ):
+        """ Undoes the assignment of the i-th cell made at depthBit."""
+        domains.undo(mark)
+        culprits = self.culprits
+        for j in domains.peers[i]:
+            culprits[j] &= ~depthBit
+        self.stack.pop()
+        del assignment[current]
+
+    def learn( self, conflict ):
+        """ Stores the assignments of the conflict set as a nogood."""
+        if not self.learning or not conflict or self.nbNogoods >= self.maxNogoods:
+            return
+        nogood = []
+        depth = 0
+        while conflict:
+            if conflict & 1:
+                nogood.append(self.stack[depth])
+            conflict >>= 1
+            depth += 1
+        if len(nogood) > self.maxNogoodSize:
+            return
+        nogood = tuple(nogood)
+        for pair in nogood:
+            self.nogoods.setdefault(pair, []).append(nogood)
+        self.nbNogoods += 1
+
+    def refusedBy( self, i, value, assignment, domains ):
+        """ Returns the conflict set (depths of the other assignments) of a
+        learned nogood completed by assigning value to the i-th cell,
+        or None."""
+        if not self.nbNogoods:
+            return None
+        cells = domains.cells
+        for nogood in self.nogoods.get((i, value), ()):
+            if all(assignment.get(cells[j]) == other for j, other in nogood):
+                depths = dict((pair, depth) for depth, pair in enumerate(self.stack))
+                conflict = 0
+                for pair in nogood:
+                    if pair != (i, value):
+                        conflict |= 1 << depths[pair]
+                return conflict
+        return None
+
+#######
+####### Parallel Forward Checking
+#######
+class ParallelFC( FC ):
+    """ Forward checking on several processes for a single hard puzzle.
+
+    The top of the search tree is expanded in the current process down to
+    splitDepth branching levels. Each open node becomes a subproblem: the
+    partial assignment and the bitmasks of its reduced domains. The
+    subproblems go, in search order, through the shared task queue of a
+    pool of processes, so an idle worker always takes the next pending
+    subproblem. As soon as one worker finds a solution, all the workers
+    are terminated."""
+
+    @instrumented
+    def solve( self, grid, heuristicFunction = defaultHeuristic, processes = None, splitDepth = None ):
+        """ Returns a solution as a dictionary of assignment, eg: {0:'2', 1:'3', ...40:'5'}
+        or None if no solution is found.
+        @param grid the current puzzle grid.
+        @param heuristicFunction the function used to choose the next cell to considered.
+        @param processes the number of worker processes, all the cores by default.
+        @param splitDepth the number of branching levels expanded before
+        handing the subproblems to the workers; by default enough to give
+        about four subproblems to each worker."""
+        processes = processes or cpu_count()
+        if splitDepth is None:
+            splitDepth = int(math.ceil(math.log(4 * processes, 2)))
+        domains = DomainStore(grid.getDomainValues(), grid)
+        subproblems = []
+        solution = self.split({}, domains, grid, heuristicFunction, splitDepth, subproblems)
+        if solution is not None or not subproblems:
+            return solution
+        pool = Pool(processes, _initParallelWorker, (grid, heuristicFunction))
+        try:
+            for solution, stats in pool.imap_unordered(_solveSubproblem, subproblems):
+                for field in ['nodes', 'backtracks', 'wipeouts', 'removals']:
+                    setattr(self.stats, field, getattr(self.stats, field) + stats[field])
+                if solution is not None:
+                    return solution
+            return None
+        finally:
+            pool.terminate()
+            pool.join()
+
+    def split( self, assignment, domains, grid, heuristicFunction, depth, subproblems ):
+        """ Same search as recursiveSearch(), but the nodes reached after
+        depth branching levels are appended to subproblems as
+        (assignment, masks) instead of being searched.
+        Returns a solution found while splitting, or None."""
+        self.incrementCount()
+        if len(assignment) == len(domains):
+            return assignment
+        if depth == 0:
+            subproblems.append((dict(assignment), domains.masks.tolist()))
+            return None
+        current = heuristicFunction(domains, assignment, grid)
+        values = domains[current]
+        if len(values) > 1:
+            depth -= 1
+        domains.assign(current)
+        for value in values:
+            assignment[current] = value
+            mark = domains.mark()
+            consistent = self.forwardChecking(current, value, domains, grid) != None
+            if self.countPropagation(domains, mark, consistent):
+                solution = self.split(assignment, domains, grid, heuristicFunction, depth, subproblems)
+                if solution is not None:
+                    return solution
+            domains.undo(mark)
+            del assignment[current]
+        domains.unassign(current)
+        return None
+
+_parallelWorker = {}
+
+def _initParallelWorker( grid, heuristicFunction ):
+    _parallelWorker['grid'] = grid
+    _parallelWorker['heuristic'] = heuristicFunction
+    _parallelWorker['domains'] = grid.getDomainValues()
 
-        "*** YOUR CODE HERE ***"
-        raise Exception, "Method not implemented: solve()"
+def _solveSubproblem( subproblem ):
+    """ Solves one subproblem of ParallelFC with FC in a worker process.
+    Returns (solution or None, statistics)."""
+    assignment, masks = subproblem
+    grid = _parallelWorker['grid']
+    domains = DomainStore(_parallelWorker['domains'], grid)
+    domains.masks = array('L', masks)
+    agent = FC()
+    agent.stats.reset()
+    solution = agent.recursiveSearch(assignment, domains, grid, _parallelWorker['heuristic'])
+    return solution, agent.getStats()
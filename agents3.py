@@ -17,7 +17,12 @@
 
 from utils import manhattanDistance
 from game import Directions
-import random, utils
+import random, utils, time, math, json
+from array import array
+from collections import namedtuple, OrderedDict, deque
+from functools import wraps
+from itertools import izip
+from multiprocessing import Pool, Value
 
 from game import Agent
 
@@ -31,6 +36,285 @@ def scoreEvaluationFunction( currentGameState ):
   """
   return currentGameState.getScore()
 
+######
+###### Maze distances
+######
+
+class MazeDistances:
+  """
+    True maze distances between all the free cells of a layout, computed
+    once by a breadth-first search from every cell and stored in a flat
+    array of unsigned shorts (UNREACHABLE between disconnected cells).
+    Positions are (x, y) tuples; ghost positions between two cells are
+    rounded to the nearest cell.
+  """
+  UNREACHABLE = 65535
+
+  def __init__( self, walls ):
+    self.walls = walls
+    self.cells = [(x, y) for x in range(walls.width) for y in range(walls.height) if not walls[x][y]]
+    self.index = dict((cell, i) for i, cell in enumerate(self.cells))
+    n = len(self.cells)
+    neighbours = []
+    for x, y in self.cells:
+      neighbours.append([self.index[cell] for cell in ((x + 1, y), (x - 1, y), (x, y + 1), (x, y - 1))
+                         if cell in self.index])
+    self.matrix = array('H', [self.UNREACHABLE]) * (n * n)
+    for source in range(n):
+      row = source * n
+      self.matrix[row + source] = 0
+      queue = deque([source])
+      while queue:
+        i = queue.popleft()
+        d = self.matrix[row + i] + 1
+        for j in neighbours[i]:
+          if self.matrix[row + j] == self.UNREACHABLE:
+            self.matrix[row + j] = d
+            queue.append(j)
+
+  def cellIndex( self, position ):
+    x, y = position
+    return self.index[int(x + 0.5), int(y + 0.5)]
+
+  def distance( self, a, b ):
+    """ Returns the maze distance between the positions a and b. """
+    return self.matrix[self.cellIndex(a) * len(self.cells) + self.cellIndex(b)]
+
+  def nearest( self, position, targets ):
+    """
+      Returns (distance, target) for the target closest to position in the
+      maze, or (None, None) if there is no reachable target.
+    """
+    n = len(self.cells)
+    row = self.cellIndex(position) * n
+    best = (None, None)
+    for target in targets:
+      d = self.matrix[row + self.cellIndex(target)]
+      if d != self.UNREACHABLE and (best[0] is None or d < best[0]):
+        best = (d, target)
+    return best
+
+_mazeDistances = {}
+
+def mazeDistances( gameState ):
+  """
+    Returns the MazeDistances of the layout of gameState, built at the first
+    call for that layout. For use in evaluation functions, eg.
+    mazeDistances(state).nearest(state.getPacmanPosition(), state.getFood().asList())
+  """
+  walls = gameState.getWalls()
+  entry = _mazeDistances.get(id(walls))
+  if entry is None or entry.walls is not walls:
+    entry = _mazeDistances[id(walls)] = MazeDistances(walls)
+  return entry
+
+######
+###### Transposition table
+######
+
+# Kind of value stored in a transposition table entry.
+EXACT, LOWER, UPPER = 0, 1, 2
+
+TTEntry = namedtuple('TTEntry', ['key', 'depth', 'value', 'bound', 'generation'])
+
+class TranspositionTable:
+  """
+    Fixed-size table of search values keyed by (game state, agent index).
+
+    Each slot holds one entry storing the remaining depth of the search,
+    its value and whether the value is exact or a lower or upper bound.
+    A new entry replaces the entry of its slot if that entry comes from an
+    earlier getAction call or from a search that was not deeper, so the
+    memory used is bounded by the number of slots.
+  """
+
+  def __init__( self, size = 65536 ):
+    self.size = size
+    self.clear()
+
+  def clear( self ):
+    self.slots = [None] * self.size
+    self.generation = 0
+    self.hits = 0
+
+  def newSearch( self ):
+    """ Marks the entries stored so far as older than the next ones. """
+    self.generation += 1
+
+  def lookup( self, key, depth ):
+    """ Returns the entry of key searched at least depth plies deep, or None. """
+    entry = self.slots[hash(key) % self.size]
+    if entry is not None and entry.depth >= depth and entry.key == key:
+      self.hits += 1
+      return entry
+    return None
+
+  def store( self, key, depth, value, bound ):
+    slot = hash(key) % self.size
+    entry = self.slots[slot]
+    if entry is None or entry.generation != self.generation or depth >= entry.depth:
+      self.slots[slot] = TTEntry(key, depth, value, bound, self.generation)
+
+######
+###### Evaluation cache
+######
+
+class EvaluationCache:
+  """
+    Memoizes an evaluation function by game state, keeping the size most
+    recently used values. The cache is called like the function itself.
+    hits, misses and evictions count the lookups since the last clear.
+  """
+
+  def __init__( self, evaluationFunction, size = 65536 ):
+    self.evaluationFunction = evaluationFunction
+    self.size = size
+    self.clear()
+
+  def clear( self ):
+    self.values = OrderedDict()
+    self.hits = 0
+    self.misses = 0
+    self.evictions = 0
+
+  def hitRate( self ):
+    lookups = self.hits + self.misses
+    return float(self.hits) / lookups if lookups else 0.0
+
+  def __call__( self, gameState ):
+    values = self.values
+    try:
+      value = values.pop(gameState)
+      self.hits += 1
+    except KeyError:
+      value = self.evaluationFunction(gameState)
+      self.misses += 1
+      if len(values) >= self.size:
+        values.popitem(last = False)
+        self.evictions += 1
+    values[gameState] = value
+    return value
+
+######
+###### Search statistics
+######
+
+class SearchStats:
+  """
+    Counters of one getAction: nodes searched (also per distance from the
+    root in nodesPerDepth), successors generated, calls of the evaluation
+    function, cutoffs of alpha-beta and chance nodes, transposition table
+    hits, evaluation cache hits, misses and evictions, and wall time
+    (seconds), including the searches of the root-parallel workers.
+  """
+  FIELDS = ['nodes', 'generated', 'evaluations', 'cutoffs', 'ttHits',
+            'cacheHits', 'cacheMisses', 'cacheEvictions', 'time']
+
+  def __init__( self ):
+    self.reset()
+
+  def reset( self ):
+    self.nodes = 0
+    self.nodesPerDepth = {}
+    self.generated = 0
+    self.evaluations = 0
+    self.cutoffs = 0
+    self.ttHits = 0
+    self.cacheHits = 0
+    self.cacheMisses = 0
+    self.cacheEvictions = 0
+    self.time = 0.0
+    self.start = time.time()
+
+  def countNode( self, depth ):
+    self.nodesPerDepth[depth] = self.nodesPerDepth.get(depth, 0) + 1
+
+  def merge( self, other ):
+    """ Adds the counters of other, the statistics of a worker, except nodes and time. """
+    for depth, count in other.nodesPerDepth.iteritems():
+      self.nodesPerDepth[depth] = self.nodesPerDepth.get(depth, 0) + count
+    self.generated += other.generated
+    self.evaluations += other.evaluations
+    self.cutoffs += other.cutoffs
+    self.ttHits += other.ttHits
+    self.cacheHits += other.cacheHits
+    self.cacheMisses += other.cacheMisses
+    self.cacheEvictions += other.cacheEvictions
+
+  def countCache( self, cache, hits, misses, evictions ):
+    """ Adds the lookups of cache since it counted hits, misses and evictions. """
+    self.cacheHits += cache.hits - hits
+    self.cacheMisses += cache.misses - misses
+    self.cacheEvictions += cache.evictions - evictions
+
+  def elapsed( self ):
+    return time.time() - self.start
+
+  def asDict( self ):
+    record = dict((field, getattr(self, field)) for field in self.FIELDS)
+    record['nodesPerDepth'] = [self.nodesPerDepth.get(depth, 0) for depth in range(max(self.nodesPerDepth or [0]) + 1)]
+    return record
+
+class SearchHook:
+  """
+    Base class of the hooks of SearchAgent.addHook(): startMove is called
+    before each getAction and endMove after it with its SearchStats.
+  """
+  def startMove( self, agent, gameState ):
+    pass
+
+  def endMove( self, agent, gameState, action, stats ):
+    pass
+
+class JSONLinesTrace( SearchHook ):
+  """ Hook writing the statistics of each move as one JSON line in a file. """
+  def __init__( self, stream ):
+    """ @param stream a file opened for writing. """
+    self.stream = stream
+    self.moves = 0
+
+  def endMove( self, agent, gameState, action, stats ):
+    self.moves += 1
+    record = stats.asDict()
+    record.update(event = 'move', move = self.moves, agent = agent.__class__.__name__, action = action,
+                  depth = agent.completedDepth, branchingFactor = agent.branchingFactor)
+    self.stream.write(json.dumps(record, sort_keys = True) + '\n')
+    self.stream.flush()
+
+def instrumentedMove( getAction ):
+  """
+    Decorator for the getAction() methods of the agents: when the agent
+    has hooks, resets its statistics, measures the move and calls the
+    hooks. Without hooks it only costs this test.
+  """
+  @wraps(getAction)
+  def instrumentedGetAction( self, gameState ):
+    if not self.hooks:
+      return getAction(self, gameState)
+    stats = self.stats
+    stats.reset()
+    ttHits = self.transpositions.hits if self.transpositions is not None else 0
+    cache = self.evaluationCache
+    if cache is not None:
+      cacheCounts = cache.hits, cache.misses, cache.evictions
+    for hook in self.hooks:
+      hook.startMove(self, gameState)
+    action = getAction(self, gameState)
+    stats.time = stats.elapsed()
+    stats.nodes = self.nodes
+    if self.transpositions is not None:
+      stats.ttHits += self.transpositions.hits - ttHits
+    if cache is not None:
+      stats.countCache(cache, *cacheCounts)
+    for hook in self.hooks:
+      hook.endMove(self, gameState, action, stats)
+    return action
+  return instrumentedGetAction
+
+class SearchTimeout( Exception ):
+  """ Raised inside a search when the deadline of the move has passed. """
+  pass
+
 ######
 ###### Abstract class SearchAgent
 ######
@@ -41,31 +325,178 @@ class SearchAgent( Agent ):
     agent searchers.  Any methods defined here will be available
     to the MinimaxPacmanAgent, AlphaBetaPacmanAgent & ExpectimaxPacmanAgent.
 
-    You *do not* need to make any changes here.
+    It holds what the agents share: the transposition table, the
+    evaluation cache, the time-limited iterative deepening, the pool of
+    root-parallel workers, and the statistics and hooks of each move.
   """
 
-  def __init__( self, evalFn = 'scoreEvaluationFunction', depth = '2' ):
+  # Agents with passesRootAlpha search each root action with the best value
+  # so far as alpha, lowered by TIE_MARGIN so that an action tying with the
+  # best one gets its exact value and the tie is still broken at random.
+  passesRootAlpha = False
+  TIE_MARGIN = 1e-6
+  # Only the agents with usesTranspositions look positions up in the
+  # transposition table; the others never create one.
+  usesTranspositions = False
+
+  def __init__( self, evalFn = 'scoreEvaluationFunction', depth = '2', ttSize = '0', timeLimit = '0', processes = '0', evalCacheSize = '0' ):
     self.index = 0 # Pacman is always agent index 0
     self.evaluationFunction = utils.lookup(evalFn, globals())
+    # With evalCacheSize > 0, the evaluations are memoized by state during a
+    # game; it pays off for evaluations slower than hashing a state.
+    self.evaluationCache = None
+    if int(evalCacheSize) > 0:
+      self.evaluationCache = EvaluationCache(self.evaluationFunction, int(evalCacheSize))
+      self.evaluationFunction = self.evaluationCache
     self.depth = int(depth)
+    # The transposition table is kept from one getAction to the next
+    # during a game. It is off by default (ttSize = 0): every interior node
+    # is then hashed, which at the default depth costs about as much as the
+    # few repeated positions save. It pays off for deeper or time-limited
+    # searches, eg. ttSize = 65536.
+    self.transpositions = None
+    if self.usesTranspositions and int(ttSize) > 0:
+      self.transpositions = TranspositionTable(int(ttSize))
+    # With a time limit (seconds per move), getAction deepens the search
+    # until the limit instead of searching self.depth plies.
+    self.timeLimit = float(timeLimit)
+    self.deadline = None
+    self.cutoff = False
+    self.completedDepth = 0
+    # Nodes visited by the last getAction and the resulting effective
+    # branching factor, nodes ** (1 / depth).
+    self.nodes = 0
+    self.branchingFactor = 0.0
+    # With processes > 1, the subtrees of the root actions are searched by
+    # a pool of worker processes, created at the first move.
+    self.processes = int(processes)
+    self.pool = None
+    self.rootAlpha = None
+    # Hooks given the statistics of each move, see addHook(); self.stats
+    # is None until the first hook, so that nothing is counted without.
+    self.hooks = []
+    self.stats = None
+    self.rootDepth = 0
 
-  def isTerminalNode( self, gameState, depth ):
-    return gameState.isLose() or gameState.isWin() or depth == 0
+  def registerInitialState( self, gameState ):
+    """ Called at the start of each game. """
+    if self.transpositions is not None:
+      self.transpositions.clear()
+    if self.evaluationCache is not None:
+      self.evaluationCache.clear()
 
-class MinimaxAgent1( SearchAgent ):
-  """
-  Minimax agent assuming that there exists only one ghost. 
-  """
+  def addHook( self, hook ):
+    """
+    Adds a SearchHook (eg. JSONLinesTrace(open('trace.jsonl', 'w'))) and
+    starts counting the statistics of the moves in self.stats. With an
+    evaluation cache, only the calls it passes on to the evaluation function
+    are counted as evaluations; its lookups are counted as cache hits and
+    misses.
+    """
+    if self.stats is None:
+      self.stats = SearchStats()
+      cache = self.evaluationCache
+      evaluationFunction = cache.evaluationFunction if cache is not None else self.evaluationFunction
+      stats = self.stats
+      def countedEvaluation( gameState ):
+        stats.evaluations += 1
+        return evaluationFunction(gameState)
+      if cache is not None:
+        cache.evaluationFunction = countedEvaluation
+      else:
+        self.evaluationFunction = countedEvaluation
+    self.hooks.append(hook)
 
+  def isTerminalNode( self, gameState, depth ):
+    self.nodes += 1
+    if self.stats is not None:
+      self.stats.countNode(self.rootDepth - depth)
+    if self.deadline is not None and time.time() > self.deadline:
+      raise SearchTimeout()
+    if gameState.isLose() or gameState.isWin():
+      return True
+    if depth == 0:
+      self.cutoff = True
+      return True
+    return False
+
+  @instrumentedMove
   def getAction( self, gameState ):
     """
-    Returns the minimax action from the current gameState using self.depth
-    and self.evaluationFunction.
+    Returns the best action from the current gameState, searching
+    self.depth plies deep or, with a time limit, as deep as possible.
     """
+    if self.transpositions is not None:
+      self.transpositions.newSearch()
+    self.nodes = 0
     legalActions = gameState.getLegalActions(0)
-    nextStatesFromLegalActions = [gameState.generateSuccessor(0, action) for action in legalActions]
-    values = [self.miniMaxValue(1, nextGameState, self.depth - 1) for nextGameState in nextStatesFromLegalActions] 
+    if self.timeLimit > 0:
+      action = self.iterativeDeepening(gameState, legalActions)
+    else:
+      self.completedDepth = self.depth
+      action = self.chooseAction(legalActions, self.searchRoot(gameState, legalActions, self.depth))
+    self.branchingFactor = (self.nodes + 1) ** (1.0 / max(self.completedDepth, 1))
+    return action
+
+  def rootValues( self, gameState, legalActions, depth ):
+    """ Returns the values of the legal actions searched depth plies deep. """
+    raise Exception, "Invalid SearchAgent class, rootValues() not implemented"
 
+  def successors( self, gameState, agentIndex, legalActions ):
+    """ Yields the successors of gameState by legalActions, one at a time. """
+    for action in legalActions:
+      if self.stats is not None:
+        self.stats.generated += 1
+      yield gameState.generateSuccessor(agentIndex, action)
+
+  def successor( self, gameState, agentIndex, action ):
+    if self.stats is not None:
+      self.stats.generated += 1
+    return gameState.generateSuccessor(agentIndex, action)
+
+  def searchRoot( self, gameState, legalActions, depth ):
+    """
+    Returns the values of the legal actions, searched in this process or,
+    with self.processes > 1, one action per task in the worker processes.
+    The values are the same either way, up to the bounds returned by
+    alpha-beta for the actions that cannot be the best, so the choice of
+    the move does not depend on which worker finished first.
+    """
+    self.rootDepth = depth
+    if self.processes <= 1 or len(legalActions) <= 1:
+      return self.rootValues(gameState, legalActions, depth)
+    if self.pool is None:
+      if self.passesRootAlpha:
+        self.rootAlpha = Value('d', -9999)
+      # The workers are forked with a copy of this agent.
+      self.pool = Pool(self.processes, _initRootWorker, (self, self.rootAlpha))
+    if self.rootAlpha is not None:
+      self.rootAlpha.value = -9999
+    tasks = [(gameState, action, depth, self.deadline) for action in legalActions]
+    results = self.pool.map(_searchRootAction, tasks, 1)
+    for value, nodes, cutoff, stats in results:
+      self.nodes += nodes
+      self.cutoff = self.cutoff or cutoff
+      if stats is not None and self.stats is not None:
+        self.stats.merge(stats)
+    values = [result[0] for result in results]
+    if None in values:
+      raise SearchTimeout()
+    return values
+
+  def final( self, gameState ):
+    """ Called at the end of each game: stops the worker processes. """
+    if self.pool is not None:
+      self.pool.terminate()
+      self.pool.join()
+      self.pool = None
+
+  def __getstate__( self ):
+    state = self.__dict__.copy()
+    state['pool'] = None
+    return state
+
+  def chooseAction( self, legalActions, values ):
     # Get the index of all maxValue
     listOfAllMaxValues = []
     maxValue = max(values)    
@@ -78,16 +509,112 @@ class MinimaxAgent1( SearchAgent ):
     action = legalActions[listOfAllMaxValues[idx]]
     return action
 
+  def iterativeDeepening( self, gameState, legalActions ):
+    """
+    Searches 1, 2, 3... plies deep (one ply being a move of every agent)
+    until self.timeLimit seconds have passed and returns the best action of
+    the last completed depth. Each depth searches the best actions of the
+    previous one first. The first ply is always completed, and the
+    deepening stops early once a search was not cut by the depth limit.
+    """
+    start = time.time()
+    ply = gameState.getNumberOfAgents()
+    actions = list(legalActions)
+    self.cutoff = False
+    values = self.searchRoot(gameState, actions, ply)
+    self.completedDepth = ply
+    self.deadline = start + self.timeLimit
+    try:
+      while self.cutoff:
+        # actions and values change together, so that a search cut by the
+        # deadline leaves the values of the last completed depth in order.
+        order = sorted(range(len(actions)), key = lambda i: -values[i])
+        ordered = [actions[i] for i in order]
+        self.cutoff = False
+        values = self.searchRoot(gameState, ordered, self.completedDepth + ply)
+        actions = ordered
+        self.completedDepth += ply
+    except SearchTimeout:
+      pass
+    finally:
+      self.deadline = None
+    return self.chooseAction(actions, values)
+
+######
+###### Root-parallel search workers
+######
+
+_rootWorker = {}
+
+def _initRootWorker( agent, rootAlpha ):
+  """ Stores the copy of the agent of a worker process. """
+  _rootWorker['agent'] = agent
+  _rootWorker['alpha'] = rootAlpha
+
+def _searchRootAction( task ):
+  """
+  Searches the subtree of one root action in a worker and returns its
+  value (None after the deadline), the number of nodes visited, whether
+  the depth limit cut the search and the SearchStats of the search if the
+  agent has hooks. Alpha-beta workers start from the best bound found so
+  far by all the workers and publish their own.
+  """
+  gameState, action, depth, deadline = task
+  agent = _rootWorker['agent']
+  rootAlpha = _rootWorker['alpha']
+  ttHits = 0
+  if agent.transpositions is not None:
+    agent.transpositions.newSearch()
+    ttHits = agent.transpositions.hits
+  cache = agent.evaluationCache
+  if cache is not None:
+    cacheCounts = cache.hits, cache.misses, cache.evictions
+  if agent.stats is not None:
+    agent.stats.reset()
+  agent.nodes = 0
+  agent.cutoff = False
+  agent.deadline = deadline
+  agent.rootDepth = depth
+  try:
+    if rootAlpha is None:
+      value = agent.rootValues(gameState, [action], depth)[0]
+    else:
+      value = agent.rootValues(gameState, [action], depth, rootAlpha.value)[0]
+      with rootAlpha.get_lock():
+        rootAlpha.value = max(rootAlpha.value, value - agent.TIE_MARGIN)
+  except SearchTimeout:
+    value = None
+  finally:
+    agent.deadline = None
+  if agent.stats is not None and agent.transpositions is not None:
+    agent.stats.ttHits = agent.transpositions.hits - ttHits
+  if agent.stats is not None and cache is not None:
+    agent.stats.countCache(cache, *cacheCounts)
+  return value, agent.nodes, agent.cutoff, agent.stats
+
+class MinimaxAgent1( SearchAgent ):
+  """
+  Minimax agent assuming that there exists only one ghost. 
+  """
+
+  def rootValues( self, gameState, legalActions, depth ):
+    """
+    Returns the minimax values of the legal actions using depth
+    and self.evaluationFunction.
+    """
+    nextStatesFromLegalActions = self.successors(gameState, 0, legalActions)
+    return [self.miniMaxValue(1, nextGameState, depth - 1) for nextGameState in nextStatesFromLegalActions] 
+
   def miniMaxValue( self, agentIndex, gameState, depth ):
     if self.isTerminalNode(gameState, depth):
       return self.evaluationFunction(gameState)    
     else:
       legalActions = gameState.getLegalActions(agentIndex)
-      nextStatesFromLegalActions = [gameState.generateSuccessor(agentIndex, action) for action in legalActions]
+      nextStatesFromLegalActions = self.successors(gameState, agentIndex, legalActions)
       if agentIndex == 0: # if it's Pacman then it's a max layer
-        return max([self.miniMaxValue(1 - agentIndex, nextState, depth - 1) for nextState in nextStatesFromLegalActions])
+        return max(self.miniMaxValue(1 - agentIndex, nextState, depth - 1) for nextState in nextStatesFromLegalActions)
       else: # else if it's the ghost, then it's a min layer
-        return min([self.miniMaxValue(1 - agentIndex, nextState, depth - 1) for nextState in nextStatesFromLegalActions])
+        return min(self.miniMaxValue(1 - agentIndex, nextState, depth - 1) for nextState in nextStatesFromLegalActions)
 
 #  ______                   _            __ 
 # |  ____|                 (_)          /_ |
@@ -100,40 +627,40 @@ class MinimaxAgentN( SearchAgent ):
   """
   Minimax agent with n ghosts.
   """
-  def getAction( self, gameState ):
+  usesTranspositions = True
+
+  def rootValues( self, gameState, legalActions, depth ):
     """
-    Returns the minimax action from the current gameState using self.depth
+    Returns the minimax values of the legal actions using depth
     and self.evaluationFunction.
     """
-    legalActions = gameState.getLegalActions(0)
-    nextStatesFromLegalActions = [gameState.generateSuccessor(0, action) for action in legalActions]
-    values = [self.miniMaxValue(1, nextGameState, self.depth - 1) for nextGameState in nextStatesFromLegalActions] 
-
-    # Get the index of all maxValue
-    listOfAllMaxValues = []
-    maxValue = max(values)    
-    for i in range(0, len(values)):
-      if values[i] == maxValue:
-        listOfAllMaxValues.append(i)
-        
-    # Random when there is a tie
-    idx = random.randint(0, len(listOfAllMaxValues) - 1)
-    action = legalActions[listOfAllMaxValues[idx]]
-    return action
+    nextStatesFromLegalActions = self.successors(gameState, 0, legalActions)
+    return [self.miniMaxValue(1, nextGameState, depth - 1) for nextGameState in nextStatesFromLegalActions] 
 
   def miniMaxValue( self, agentIndex, gameState, depth ):
     if self.isTerminalNode(gameState, depth):
       return self.evaluationFunction(gameState)    
     else:
+      if self.transpositions is not None:
+        key = (gameState, agentIndex)
+        entry = self.transpositions.lookup(key, depth)
+        if entry is not None:
+          # The stored search may have been cut by the depth limit.
+          self.cutoff = True
+          return entry.value
       legalActions = gameState.getLegalActions(agentIndex)
-      nextStatesFromLegalActions = [gameState.generateSuccessor(agentIndex, action) for action in legalActions]
+      nextStatesFromLegalActions = self.successors(gameState, agentIndex, legalActions)
       if agentIndex == 0:
         # if it's Pacman then it's a max layer
-        return max([self.miniMaxValue(1 + agentIndex, nextState, depth - 1) for nextState in nextStatesFromLegalActions])
+        value = max(self.miniMaxValue(1 + agentIndex, nextState, depth - 1) for nextState in nextStatesFromLegalActions)
       else: # else if it's the ghost, then it's a min layer
         if gameState.getNumberOfAgents() - agentIndex - 1 == 0:
-          return min([self.miniMaxValue(0, nextState, depth - 1) for nextState in nextStatesFromLegalActions])
-        return min([self.miniMaxValue(1 + agentIndex, nextState, depth - 1) for nextState in nextStatesFromLegalActions])
+          value = min(self.miniMaxValue(0, nextState, depth - 1) for nextState in nextStatesFromLegalActions)
+        else:
+          value = min(self.miniMaxValue(1 + agentIndex, nextState, depth - 1) for nextState in nextStatesFromLegalActions)
+      if self.transpositions is not None:
+        self.transpositions.store(key, depth, value, EXACT)
+      return value
     
 
 #  ______                   _            ___  
@@ -146,56 +673,121 @@ class MinimaxAgentN( SearchAgent ):
 class AlphaBetaAgent(SearchAgent):
   """ 
   Your minimax agent with alpha-beta pruning.
+
+  The successors of a node are searched killer moves first (the last two
+  actions that caused a cutoff in the same layer), then by decreasing
+  history score (the sum of depth * depth over the cutoffs caused by the
+  action), so that cutoffs happen early. A layer is identified by the
+  agent to move after the action and the depth left. ordering = 0 searches
+  the successors in the order of getLegalActions.
   """
-  
-  def getAction(self, gameState):
+  passesRootAlpha = True
+  usesTranspositions = True
+
+  def __init__( self, evalFn = 'scoreEvaluationFunction', depth = '2', ttSize = '0', timeLimit = '0', processes = '0', evalCacheSize = '0',
+                ordering = '1' ):
+    SearchAgent.__init__(self, evalFn, depth, ttSize, timeLimit, processes, evalCacheSize)
+    self.ordering = bool(int(ordering))
+    self.killers = {}
+    self.history = {}
+
+  def registerInitialState( self, gameState ):
+    SearchAgent.registerInitialState(self, gameState)
+    self.killers = {}
+    self.history = {}
+
+  def rootValues(self, gameState, legalActions, depth, alpha = -9999):
     """
-      Returns the minimax action using self.depth and self.evaluationFunction
+      Returns the minimax values of the legal actions using depth and self.evaluationFunction.
+      The alpha of the root is passed from one action to the next: an action
+      that cannot beat the best one gets an upper bound of its value instead.
     """
-    legalActions = gameState.getLegalActions(0)
-    nextStatesFromLegalActions = [gameState.generateSuccessor(0, action) for action in legalActions]
-    values = [self.miniMaxValue(-9999, 9999, 1, nextGameState, self.depth - 1) for nextGameState in nextStatesFromLegalActions] 
+    nextStatesFromLegalActions = self.successors(gameState, 0, legalActions)
+    values = []
+    for nextGameState in nextStatesFromLegalActions:
+      value = self.miniMaxValue(alpha, 9999, 1, nextGameState, depth - 1)
+      values.append(value)
+      alpha = max(alpha, value - self.TIE_MARGIN)
+    return values
 
-    # Get the index of all maxValue
-    listOfAllMaxValues = []
-    maxValue = max(values)    
-    for i in range(0, len(values)):
-      if values[i] == maxValue:
-        listOfAllMaxValues.append(i)
-        
-    # Random when there is a tie
-    idx = random.randint(0, len(listOfAllMaxValues) - 1)
-    action = legalActions[listOfAllMaxValues[idx]]
-    return action
+  def orderActions( self, agentIndex, depth, legalActions ):
+    """ Returns the actions leading to the layer (agentIndex, depth), killer moves first and then by history score. """
+    if not self.ordering:
+      return legalActions
+    killers = self.killers.get((agentIndex, depth), ())
+    history = self.history
+    return sorted(legalActions, key = lambda action: (action not in killers,
+                                                      -history.get((agentIndex, action), 0)))
+
+  def recordCutoff( self, agentIndex, depth, action ):
+    """ Remembers that action caused a cutoff in the layer (agentIndex, depth). """
+    if not self.ordering:
+      return
+    killers = self.killers.get((agentIndex, depth), ())
+    if action not in killers:
+      self.killers[agentIndex, depth] = (action,) + killers[:1]
+    self.history[agentIndex, action] = self.history.get((agentIndex, action), 0) + depth * depth
 
   def miniMaxValue( self, alpha, beta, agentIndex, gameState, depth ):
     if self.isTerminalNode(gameState, depth):
       return self.evaluationFunction(gameState)    
     else:
-      legalActions = gameState.getLegalActions(agentIndex)
-      nextStatesFromLegalActions = [gameState.generateSuccessor(agentIndex, action) for action in legalActions]
+      if self.transpositions is not None:
+        key = (gameState, agentIndex)
+        entry = self.transpositions.lookup(key, depth)
+        if entry is not None:
+          # The stored search may have been cut by the depth limit.
+          self.cutoff = True
+          if entry.bound == EXACT:
+            return entry.value
+          if entry.bound == LOWER and entry.value >= beta:
+            return entry.value
+          if entry.bound == UPPER and entry.value <= alpha:
+            return entry.value
+      nextAgent = (agentIndex + 1) % gameState.getNumberOfAgents()
+      legalActions = self.orderActions(nextAgent, depth - 1, gameState.getLegalActions(agentIndex))
+      # Successors are generated one at a time when they are searched, so
+      # the ones after a cutoff are never built.
+      nextStatesFromLegalActions = self.successors(gameState, agentIndex, legalActions)
       if agentIndex == 0:
         # if it's Pacman then it's a max layer
-        return self.max_val(alpha, beta, 1 + agentIndex, nextStatesFromLegalActions, depth - 1) 
+        value = self.max_val(alpha, beta, 1 + agentIndex, nextStatesFromLegalActions, depth - 1, legalActions) 
       else: # else if it's the ghost, then it's a min layer
         if gameState.getNumberOfAgents() - agentIndex - 1 == 0:  
-          return self.min_val(alpha, beta, 0, nextStatesFromLegalActions, depth - 1)
-        return self.min_val(alpha, beta, 1 + agentIndex, nextStatesFromLegalActions, depth - 1)
+          value = self.min_val(alpha, beta, 0, nextStatesFromLegalActions, depth - 1, legalActions)
+        else:
+          value = self.min_val(alpha, beta, 1 + agentIndex, nextStatesFromLegalActions, depth - 1, legalActions)
+      if self.transpositions is not None:
+        # A value outside the window is only a bound of the true value.
+        if value <= alpha:
+          bound = UPPER
+        elif value >= beta:
+          bound = LOWER
+        else:
+          bound = EXACT
+        self.transpositions.store(key, depth, value, bound)
+      return value
 
-  def max_val(self, alpha, beta, agentIndex, nextStates, depth):
+  def max_val(self, alpha, beta, agentIndex, nextStates, depth, actions):
     v = -9999
-    for state in nextStates:
+    for action, state in izip(actions, nextStates):
       v = max(v, self.miniMaxValue(alpha, beta, agentIndex, state, depth))
       if v >= beta:
+        if self.stats is not None:
+          self.stats.cutoffs += 1
+        self.recordCutoff(agentIndex, depth, action)
         return v
       alpha = max(alpha, v)
     return v
   
-  def min_val(self, alpha, beta, agentIndex, nextStates, depth):
+  def min_val(self, alpha, beta, agentIndex, nextStates, depth, actions):
     v = 9999
-    for state in nextStates:
+    for action, state in izip(actions, nextStates):
       v = min(v, self.miniMaxValue(alpha, beta, agentIndex, state, depth))
       if v <= alpha:
+        if self.stats is not None:
+          self.stats.cutoffs += 1
+        self.recordCutoff(agentIndex, depth, action)
         return v
       beta = min(beta, v)
     return v
@@ -208,58 +800,313 @@ class AlphaBetaAgent(SearchAgent):
 # | |____ >  <  __/ | | (__| \__ \  __/  ___) |
 # |______/_/\_\___|_| \___|_|___/\___|  |____/ 
 
+def uniformDistribution( gameState, agentIndex, legalActions ):
+  """
+    The ghost distribution of ExpectimaxAgent: every legal action of the
+    ghost is equally likely. A distribution returns the probabilities of
+    legalActions in the same order.
+  """
+  return [1.0 / len(legalActions)] * len(legalActions)
+
 class ExpectimaxAgent( SearchAgent ):
   """
   Expectimax agent assuming random ghosts.
+
+  The ghosts move according to distribution, the name of a function like
+  uniformDistribution. Chance nodes are pruned with Star1: knowing that
+  every value lies in [lowerBound, upperBound], a ghost node stops as soon
+  as its expected value can no longer enter the (alpha, beta) window of
+  its parent. When the ghost node is followed by Pacman, Star2 first
+  probes every child with its first action only, which gives lower bounds
+  of the children and may cut the node before any full search.
+  Evaluations outside the bounds are clamped into them, so the tighter the
+  bounds, the more is pruned. The chance-node children skipped by the
+  last getAction in this process (not in the root-parallel workers) are
+  counted in self.skipped.
   """
+  passesRootAlpha = True
+
+  def __init__( self, evalFn = 'scoreEvaluationFunction', depth = '2', ttSize = '0', timeLimit = '0', processes = '0', evalCacheSize = '0',
+                distribution = 'uniformDistribution', lowerBound = '-9999', upperBound = '9999', probing = '1' ):
+    SearchAgent.__init__(self, evalFn, depth, ttSize, timeLimit, processes, evalCacheSize)
+    self.distribution = utils.lookup(distribution, globals())
+    self.lowerBound = float(lowerBound)
+    self.upperBound = float(upperBound)
+    self.probing = bool(int(probing))
+    self.skipped = 0
+
   def getAction( self, gameState ):
+    self.skipped = 0
+    return SearchAgent.getAction(self, gameState)
+
+  def rootValues( self, gameState, legalActions, depth, alpha = -9999 ):
     """
-    Returns the minimax action from the current gameState using self.depth
-    and self.evaluationFunction.
+    Returns the expectimax values of the legal actions using depth
+    and self.evaluationFunction. As in AlphaBetaAgent, an action that
+    cannot beat the best one gets an upper bound of its value instead.
     """
-    legalActions = gameState.getLegalActions(0)
-    nextStatesFromLegalActions = [gameState.generateSuccessor(0, action) for action in legalActions]
-    values = [self.expectiMax(1, nextGameState, self.depth - 1) for nextGameState in nextStatesFromLegalActions] 
-
-    # Get the index of all maxValue
-    listOfAllMaxValues = []
-    maxValue = max(values)    
-    for i in range(0, len(values)):
-      if values[i] == maxValue:
-        listOfAllMaxValues.append(i)
-        
-    # Random when there is a tie
-    idx = random.randint(0, len(listOfAllMaxValues) - 1)
-    action = legalActions[listOfAllMaxValues[idx]]
-    return action
+    nextStatesFromLegalActions = self.successors(gameState, 0, legalActions)
+    values = []
+    for nextGameState in nextStatesFromLegalActions:
+      value = self.expectiMax(1, nextGameState, depth - 1, alpha, self.upperBound)
+      values.append(value)
+      alpha = max(alpha, value - self.TIE_MARGIN)
+    return values
 
-  def expectiMax( self, agentIndex, gameState, depth ):
+  def expectiMax( self, agentIndex, gameState, depth, alpha, beta ):
     if self.isTerminalNode(gameState, depth):
-      return self.evaluationFunction(gameState)    
+      return min(max(self.evaluationFunction(gameState), self.lowerBound), self.upperBound)
     else:
+      nextAgent = (agentIndex + 1) % gameState.getNumberOfAgents()
       legalActions = gameState.getLegalActions(agentIndex)
-      nextStatesFromLegalActions = [gameState.generateSuccessor(agentIndex, action) for action in legalActions]
       if agentIndex == 0:
         # if it's Pacman then it's a max layer
-        return self.max_val( 1 + agentIndex, nextStatesFromLegalActions, depth - 1) 
-      else: # else if it's the ghost, then it's a min layer
-        if gameState.getNumberOfAgents() - agentIndex - 1 == 0:  
-          return self.min_val(0, nextStatesFromLegalActions, depth - 1)
-        return self.min_val( 1 + agentIndex, nextStatesFromLegalActions, depth - 1)
+        nextStatesFromLegalActions = self.successors(gameState, agentIndex, legalActions)
+        return self.max_val(alpha, beta, nextAgent, nextStatesFromLegalActions, depth - 1)
+      else: # else if it's the ghost, then it's a chance layer
+        probabilities = self.distribution(gameState, agentIndex, legalActions)
+        weightedActions = [(p, action) for p, action in izip(probabilities, legalActions) if p > 0]
+        probabilities = [p for p, action in weightedActions]
+        nextStatesFromLegalActions = self.successors(gameState, agentIndex, [action for p, action in weightedActions])
+        if self.probing and nextAgent == 0 and depth > 1:
+          return self.probed_chance_val(alpha, beta, nextStatesFromLegalActions, probabilities, depth - 1)
+        return self.chance_val(alpha, beta, nextAgent, nextStatesFromLegalActions, probabilities, depth - 1)
 
-  def max_val(self, agentIndex, nextStates, depth):
-    v = -9999
+  def max_val(self, alpha, beta, agentIndex, nextStates, depth, v = None):
+    # v is the value of the successors already searched, if any.
+    if v is None:
+      v = self.lowerBound
+    elif v >= beta:
+      return v
     for state in nextStates:
-      v = max(v, self.expectiMax(agentIndex, state, depth))
-    return v
-  
-  def min_val(self, agentIndex, nextStates, depth):
-    v = 9999
-    for state in nextStates:
-      v = min(v, self.expectiMax(agentIndex, state, depth))
+      v = max(v, self.expectiMax(agentIndex, state, depth, max(alpha, v), beta))
+      if v >= beta:
+        if self.stats is not None:
+          self.stats.cutoffs += 1
+        return v
     return v
-      
+
+  def skip( self, count ):
+    """ Counts a cutoff of a chance node, skipping its count last children. """
+    self.skipped += count
+    if self.stats is not None:
+      self.stats.cutoffs += 1
+
+  def chance_val(self, alpha, beta, agentIndex, nextStates, probabilities, depth, lowerBounds = None, probes = None,
+                 exactValues = None):
+    """
+    Star1: returns the expected value of the children, or a bound of it
+    outside (alpha, beta) when the children left cannot bring it back in.
+    lowerBounds are lower bounds of the children values (by default
+    self.lowerBound). probes are the exact values of the first action of
+    the Pacman children found by probed_chance_val, or None; the search of
+    these children resumes from their second action. exactValues are the
+    values of the terminal children already evaluated by probed_chance_val,
+    or None.
+    """
+    if lowerBounds is None:
+      lowerBounds = [self.lowerBound] * len(probabilities)
+    total = 0.0
+    remaining = 1.0
+    lowerRest = sum(p * lower for p, lower in izip(probabilities, lowerBounds))
+    for i, state in enumerate(nextStates):
+      p = probabilities[i]
+      remaining -= p
+      lowerRest -= p * lowerBounds[i]
+      childAlpha = max((alpha - total - remaining * self.upperBound) / p, self.lowerBound)
+      childBeta = min((beta - total - lowerRest) / p, self.upperBound)
+      if exactValues is not None and exactValues[i] is not None:
+        total += p * exactValues[i]
+      elif probes is not None and probes[i] is not None:
+        nextStatesFromLegalActions = self.successors(state, 0, state.getLegalActions(0)[1:])
+        total += p * self.max_val(childAlpha, childBeta, 1, nextStatesFromLegalActions, depth - 1, probes[i])
+      else:
+        total += p * self.expectiMax(agentIndex, state, depth, childAlpha, childBeta)
+      if total + remaining * self.upperBound <= alpha:
+        self.skip(len(probabilities) - i - 1)
+        return total + remaining * self.upperBound
+      if total + lowerRest >= beta:
+        self.skip(len(probabilities) - i - 1)
+        return total + lowerRest
+    return total
+
+  def probed_chance_val(self, alpha, beta, nextStates, probabilities, depth):
+    """
+    Star2 for a chance layer followed by Pacman: the value of the first
+    action of each child is a lower bound of the child. Stops with a lower
+    bound if they already reach beta, else searches the children with
+    chance_val using these lower bounds and the probes.
+    """
+    nextStates = list(nextStates)
+    lowerBounds = [self.lowerBound] * len(probabilities)
+    probes = [None] * len(probabilities)
+    exactValues = [None] * len(probabilities)
+    lowerTotal = self.lowerBound
+    for i, state in enumerate(nextStates):
+      p = probabilities[i]
+      probeBeta = min((beta - lowerTotal) / p + self.lowerBound, self.upperBound)
+      if self.isTerminalNode(state, depth):
+        lowerBounds[i] = min(max(self.evaluationFunction(state), self.lowerBound), self.upperBound)
+        exactValues[i] = lowerBounds[i]
+      else:
+        firstState = self.successor(state, 0, state.getLegalActions(0)[0])
+        lowerBounds[i] = self.expectiMax(1, firstState, depth - 1, self.lowerBound, probeBeta)
+        if lowerBounds[i] < probeBeta:
+          probes[i] = lowerBounds[i]
+      lowerTotal += p * (lowerBounds[i] - self.lowerBound)
+      if lowerTotal >= beta:
+        self.skip(len(probabilities) - i - 1)
+        return lowerTotal
+    return self.chance_val(alpha, beta, 0, iter(nextStates), probabilities, depth, lowerBounds, probes, exactValues)
     
+######
+###### Monte Carlo tree search
+######
+
+class MCTSNode:
+  """
+    A node of the tree of MCTSAgent: gameState with agentIndex to move.
+    total is the sum of the values (for Pacman) of the visits of the node.
+  """
+
+  def __init__( self, gameState, agentIndex, parent = None, action = None ):
+    self.gameState = gameState
+    self.agentIndex = agentIndex
+    self.parent = parent
+    self.action = action
+    self.children = []
+    if gameState.isWin() or gameState.isLose():
+      self.untriedActions = []
+    else:
+      self.untriedActions = list(gameState.getLegalActions(agentIndex))
+      random.shuffle(self.untriedActions)
+    self.visits = 0
+    self.total = 0.0
+
+class MCTSAgent( SearchAgent ):
+  """
+  Monte Carlo tree search agent.
+
+  Each iteration walks down the tree with UCT, Pacman maximizing and each
+  ghost minimizing the mean value of the children (scaled to [0, 1] by the
+  extreme values seen in the game) plus exploration * sqrt(ln N / n). It
+  then adds one child, plays random moves for rolloutDepth agent moves
+  from it and backs up self.evaluationFunction of the state reached, so
+  rolloutDepth = 0 evaluates the new leaf directly. The budget of a move
+  is iterations, or milliseconds when it is not 0. With reuse, the
+  subtree of the state actually reached is kept for the next move.
+  """
+
+  def __init__( self, evalFn = 'scoreEvaluationFunction', iterations = '1000', milliseconds = '0', exploration = '1.41',
+                rolloutDepth = '10', reuse = '1' ):
+    SearchAgent.__init__(self, evalFn)
+    self.iterations = int(iterations)
+    self.milliseconds = float(milliseconds)
+    self.exploration = float(exploration)
+    self.rolloutDepth = int(rolloutDepth)
+    self.reuse = bool(int(reuse))
+    self.root = None
+    self.lowest = None
+    self.highest = None
+    self.completedIterations = 0
+
+  def registerInitialState( self, gameState ):
+    SearchAgent.registerInitialState(self, gameState)
+    self.root = None
+    self.lowest = None
+    self.highest = None
+
+  @instrumentedMove
+  def getAction( self, gameState ):
+    """
+    Returns the most visited action of the root after the budget of the move.
+    """
+    self.nodes = 0
+    root = self.reusedRoot(gameState) if self.reuse else None
+    if root is None:
+      root = MCTSNode(gameState, 0)
+    root.parent = None
+    deadline = time.time() + self.milliseconds / 1000.0
+    self.completedIterations = 0
+    while True:
+      self.iterate(root)
+      self.completedIterations += 1
+      if self.milliseconds > 0:
+        if time.time() >= deadline:
+          break
+      elif self.completedIterations >= self.iterations:
+        break
+    actions = [child.action for child in root.children]
+    visits = [child.visits for child in root.children]
+    action = self.chooseAction(actions, visits)
+    self.root = root.children[actions.index(action)]
+    return action
+
+  def reusedRoot( self, gameState ):
+    """
+    Returns the node of gameState among the descendants of the node kept
+    from the previous move (Pacman's move followed by one move of each
+    ghost), or None.
+    """
+    if self.root is None:
+      return None
+    layer = [self.root]
+    for ghost in range(1, gameState.getNumberOfAgents()):
+      layer = [child for node in layer for child in node.children]
+    for node in layer:
+      if node.agentIndex == 0 and node.gameState == gameState:
+        return node
+    return None
+
+  def iterate( self, root ):
+    node = root
+    depth = 0
+    while not node.untriedActions and node.children:
+      node = self.select(node)
+      depth += 1
+    if node.untriedActions:
+      action = node.untriedActions.pop()
+      nextAgent = (node.agentIndex + 1) % node.gameState.getNumberOfAgents()
+      child = MCTSNode(self.successor(node.gameState, node.agentIndex, action), nextAgent, node, action)
+      node.children.append(child)
+      node = child
+      self.nodes += 1
+      if self.stats is not None:
+        self.stats.countNode(depth + 1)
+    value = self.rollout(node.gameState, node.agentIndex)
+    if self.lowest is None or value < self.lowest:
+      self.lowest = value
+    if self.highest is None or value > self.highest:
+      self.highest = value
+    while node is not None:
+      node.visits += 1
+      node.total += value
+      node = node.parent
+
+  def select( self, node ):
+    """ Returns the child of node with the best upper confidence bound. """
+    scale = self.highest - self.lowest
+    logVisits = math.log(node.visits)
+    bestScore, bestChild = None, None
+    for child in node.children:
+      mean = (child.total / child.visits - self.lowest) / scale if scale > 0 else 0.5
+      if node.agentIndex != 0:
+        mean = 1 - mean
+      score = mean + self.exploration * math.sqrt(logVisits / child.visits)
+      if bestScore is None or score > bestScore:
+        bestScore, bestChild = score, child
+    return bestChild
+
+  def rollout( self, gameState, agentIndex ):
+    """ Plays random moves from gameState and returns the evaluation of the state reached. """
+    numberOfAgents = gameState.getNumberOfAgents()
+    for move in range(self.rolloutDepth):
+      if gameState.isWin() or gameState.isLose():
+        break
+      gameState = self.successor(gameState, agentIndex, random.choice(gameState.getLegalActions(agentIndex)))
+      agentIndex = (agentIndex + 1) % numberOfAgents
+    return self.evaluationFunction(gameState)
+
 #  ______                   _            _  _   
 # |  ____|                 (_)          | || |  
 # | |__  __  _____ _ __ ___ _ ___  ___  | || |_ 
@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+#
+# ENSICAEN
+# École Nationale Supérieure d'Ingénieurs de Caen
+# 6 Boulevard Maréchal Juin
+# F-14050 Caen Cedex France
+#
+# Artificial Intelligence 2I1AE1
+#
+
+#
+# @file batchSolver.py
+#
+# Solves a corpus of Sudoku puzzles with the agents of agents2.py,
+# spreading the puzzles over a pool of worker processes.
+#
+# Usage: python batchSolver.py -f puzzles.txt -a AC_AC -H mrvHeuristic -j 4 -t 10
+#
+
+import signal
+import sys
+from collections import namedtuple
+from multiprocessing import Pool, cpu_count
+from optparse import OptionParser
+
+import agents2
+from grid import Grid
+
+# Result of one puzzle: status is 'solved', 'unsolvable', 'timeout' or
+# 'error', or 'consistent' for an agent that only prunes the domains
+# (AC3); solution is the assignment, or the domains, returned by the
+# agent (or None) and stats the counters of agents2.Agent.getStats().
+BatchResult = namedtuple('BatchResult', ['index', 'puzzle', 'status', 'solution', 'stats'])
+
+def readPuzzles( source ):
+    """ Yields the puzzles of a file, one per line.
+    Blank lines and lines starting with '#' are skipped.
+    @param source a file name or an open file."""
+    stream = open(source) if isinstance(source, basestring) else source
+    try:
+        for line in stream:
+            line = line.strip()
+            if line and not line.startswith('#'):
+                yield line
+    finally:
+        if stream is not source:
+            stream.close()
+
+def isAssignment( solution ):
+    """ Returns whether the result of an agent assigns a value to every
+    cell, instead of giving the domains left (a list per cell)."""
+    return not any(isinstance(value, list) for value in solution.values())
+
+def solutionString( solution ):
+    """ Returns the values of an assignment in cell order, eg. '4839216...'.
+    For domains, a cell with more than one value left is written '.'."""
+    return ''.join(solutionValue(solution[cell]) for cell in sorted(solution))
+
+def solutionValue( value ):
+    if not isinstance(value, list):
+        return value
+    return value[0] if len(value) == 1 else '.'
+
+class Timeout( Exception ):
+    pass
+
+def _raiseTimeout( signum, frame ):
+    raise Timeout()
+
+_settings = {}
+
+def _initWorker( agentName, heuristicName, timeout ):
+    """ Stores the batch settings in the worker process."""
+    _settings['agent'] = getattr(agents2, agentName)
+    _settings['heuristic'] = getattr(agents2, heuristicName) if heuristicName else None
+    _settings['timeout'] = timeout
+    if timeout:
+        signal.signal(signal.SIGALRM, _raiseTimeout)
+
+def _solvePuzzle( task ):
+    """ Solves one puzzle in a worker. The timeout is enforced with a
+    real-time interval timer, so it also stops a solve stuck in Python code."""
+    index, puzzle = task
+    agent = _settings['agent']()
+    timeout = _settings['timeout']
+    if timeout:
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        try:
+            if _settings['heuristic'] is None:
+                solution = agent.solve(Grid(puzzle))
+            else:
+                solution = agent.solve(Grid(puzzle), _settings['heuristic'])
+        finally:
+            if timeout:
+                signal.setitimer(signal.ITIMER_REAL, 0)
+    except Timeout:
+        stats = agent.getStats()
+        stats['time'] = agent.stats.elapsed()
+        return BatchResult(index, puzzle, 'timeout', None, stats)
+    except Exception, e:
+        return BatchResult(index, puzzle, 'error', repr(e), agent.getStats())
+    if solution is None:
+        status = 'unsolvable'
+    else:
+        status = 'solved' if isAssignment(solution) else 'consistent'
+    return BatchResult(index, puzzle, status, solution, agent.getStats())
+
+def solveBatch( puzzles, agentName = 'FC', heuristicName = None, processes = None,
+                chunksize = 1, timeout = None, ordered = True ):
+    """ Solves an iterable of puzzles (eg. readPuzzles(fileName) or a
+    generator) over a pool of processes and yields a BatchResult as soon
+    as each puzzle is solved.
+
+    @param agentName the name of the agent class in agents2.py, eg. 'AC_AC'.
+    @param heuristicName the name of the heuristic function in agents2.py,
+    or None for the default one (BS and IncrementalBS ignore it and DLX does not take one).
+    @param processes the number of worker processes, all the cores by default.
+    With 1, the puzzles are solved in the current process.
+    @param chunksize the number of puzzles sent to a worker at once.
+    @param timeout the maximum time in seconds spent on each puzzle, or None.
+    @param ordered yield the results in the order of the puzzles instead of
+    in the order they complete."""
+    tasks = enumerate(puzzles)
+    if processes == 1:
+        _initWorker(agentName, heuristicName, timeout)
+        for task in tasks:
+            yield _solvePuzzle(task)
+        return
+    pool = Pool(processes or cpu_count(), _initWorker, (agentName, heuristicName, timeout))
+    try:
+        if ordered:
+            results = pool.imap(_solvePuzzle, tasks, chunksize)
+        else:
+            results = pool.imap_unordered(_solvePuzzle, tasks, chunksize)
+        for result in results:
+            yield result
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+
+def readCommand( argv ):
+    parser = OptionParser(usage = "python batchSolver.py -f FILE [options]")
+    parser.add_option('-f', '--file', dest = 'file', help = 'the puzzle file, one puzzle per line (default: stdin)')
+    parser.add_option('-a', '--agent', dest = 'agent', default = 'FC', help = 'the agent of agents2.py [default: %default]')
+    parser.add_option('-H', '--heuristic', dest = 'heuristic', default = None, help = 'the heuristic function of agents2.py')
+    parser.add_option('-j', '--processes', dest = 'processes', type = 'int', default = None, help = 'the number of processes [default: all cores]')
+    parser.add_option('-c', '--chunksize', dest = 'chunksize', type = 'int', default = 1, help = 'the number of puzzles per task [default: %default]')
+    parser.add_option('-t', '--timeout', dest = 'timeout', type = 'float', default = None, help = 'the time limit per puzzle in seconds')
+    parser.add_option('-u', '--unordered', dest = 'ordered', action = 'store_false', default = True, help = 'print the results as they complete')
+    options, otherjunk = parser.parse_args(argv)
+    if otherjunk:
+        raise Exception('Command line input not understood: ' + str(otherjunk))
+    return options
+
+if __name__ == '__main__':
+    options = readCommand(sys.argv[1:])
+    puzzles = readPuzzles(options.file or sys.stdin)
+    for result in solveBatch(puzzles, options.agent, options.heuristic, options.processes,
+                             options.chunksize, options.timeout, options.ordered):
+        solved = result.status in ('solved', 'consistent')
+        solution = solutionString(result.solution) if solved else '-'
+        print '%d %s %.3fs %d %s' % (result.index, result.status, result.stats['time'],
+                                      result.stats['nodes'], solution)
+        sys.stdout.flush()
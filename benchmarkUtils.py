@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+#
+# ENSICAEN
+# École Nationale Supérieure d'Ingénieurs de Caen
+# 6 Boulevard Maréchal Juin
+# F-14050 Caen Cedex France
+#
+# Artificial Intelligence 2I1AE1
+#
+
+#
+# @file benchmarkUtils.py
+#
+# Helpers shared by the headless benchmarks, sudokuBenchmark.py and
+# pacmanBenchmark.py: running the cases, percentiles and the comparison
+# of a run with a baseline.
+#
+
+import math
+from multiprocessing import Pool
+
+def percentile( values, p ):
+    """ Returns the p-th percentile of values (nearest rank), or None."""
+    if not values:
+        return None
+    values = sorted(values)
+    rank = int(math.ceil(p / 100.0 * len(values))) - 1
+    return values[min(max(rank, 0), len(values) - 1)]
+
+def formatTime( seconds ):
+    return '%9.4f' % seconds if seconds is not None else '        -'
+
+def runCases( runCase, cases, processes = 1 ):
+    """ Returns the results of runCase on every case, each case run in a
+    fresh worker process so that the memory peak belongs to the case.
+
+    @param processes the number of cases run at the same time; keep 1 for
+    timings that do not depend on the load of the machine."""
+    pool = Pool(processes, maxtasksperchild = 1)
+    try:
+        return pool.map(runCase, cases, 1)
+    finally:
+        pool.terminate()
+        pool.join()
+
+def compareResults( results, baseline, caseKey, caseName, check, tolerance = 0.2 ):
+    """ Returns the list of the regressions of results against the results
+    of a previous run with the same caseKey(): those returned by
+    check(name, result, base), then a median time more than tolerance above
+    the baseline (and by more than 1 ms). The cases missing from the
+    baseline are skipped.
+
+    @param caseName returns the name of a result in the regressions."""
+    previous = dict((caseKey(result), result) for result in baseline)
+    regressions = []
+    for result in results:
+        base = previous.get(caseKey(result))
+        if base is None:
+            continue
+        name = caseName(result)
+        regressions.extend(check(name, result, base))
+        if result['p50'] is not None and base['p50'] is not None:
+            if result['p50'] > base['p50'] * (1 + tolerance) and result['p50'] - base['p50'] > 0.001:
+                regressions.append('%s: p50 %.4fs > %.4fs' % (name, result['p50'], base['p50']))
+    return regressions
@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+#
+# ENSICAEN
+# École Nationale Supérieure d'Ingénieurs de Caen
+# 6 Boulevard Maréchal Juin
+# F-14050 Caen Cedex France
+#
+# Artificial Intelligence 2I1AE1
+#
+
+#
+# @file pacmanBenchmark.py
+#
+# Headless benchmark of the search agents of agents3.py: each agent
+# chooses a move in the same fixed positions, drawn with a seed from
+# random games, across layouts, ghost counts and depths.
+#
+# Usage: python pacmanBenchmark.py -l smallClassic -g 1,2 -d 2,4 --json run.json
+#        python pacmanBenchmark.py --baseline run.json
+#
+
+import hashlib
+import json
+import random
+import resource
+import sys
+import time
+from optparse import OptionParser
+
+import agents3
+import layout
+from benchmarkUtils import percentile, formatTime, runCases, compareResults
+from pacman import GameState
+
+AGENTS = ['MinimaxAgentN', 'AlphaBetaAgent', 'ExpectimaxAgent']
+LAYOUTS = ['smallClassic', 'mediumClassic']
+GHOSTS = [1, 2, 4]
+DEPTHS = [2, 4]
+
+def fixedPositions( layoutName, ghosts, count, seed, stride = 5 ):
+  """
+    Returns count positions where Pacman is to move, taken every stride
+    moves of random games on the layout, the same for a given seed.
+    A game that ends is started again.
+  """
+  theLayout = layout.getLayout(layoutName)
+  if theLayout is None:
+    raise Exception("The layout " + layoutName + " cannot be found")
+  generator = random.Random(seed)
+  positions = []
+  state = None
+  move = 0
+  while len(positions) < count:
+    if state is None or state.isWin() or state.isLose():
+      state = GameState()
+      state.initialize(theLayout, ghosts)
+      move = 0
+    if move % stride == 0:
+      positions.append(state)
+    for agentIndex in range(state.getNumberOfAgents()):
+      if state.isWin() or state.isLose():
+        break
+      state = state.generateSuccessor(agentIndex, generator.choice(state.getLegalActions(agentIndex)))
+    move += 1
+  return positions
+
+def runCase( case ):
+  """
+    Times getAction of one agent in every position of a case. The
+    positions are played warmup times untimed, then repetitions times.
+    The random generator is seeded before each move, so the ties are
+    broken the same way from one run to the next.
+  """
+  agentName, layoutName, ghosts, depth, count, seed, warmup, repetitions = case
+  positions = fixedPositions(layoutName, ghosts, count, seed)
+  agent = getattr(agents3, agentName)(depth = str(depth))
+  times, nodes, actions = [], 0, []
+  for run in range(warmup + repetitions):
+    agent.registerInitialState(positions[0])
+    for index, state in enumerate(positions):
+      random.seed(seed + index)
+      start = time.time()
+      action = agent.getAction(state)
+      elapsed = time.time() - start
+      if run >= warmup:
+        times.append(elapsed)
+        nodes += agent.nodes
+        if run == warmup:
+          actions.append(action)
+  return {'agent': agentName, 'layout': layoutName, 'ghosts': positions[0].getNumberOfAgents() - 1,
+          'depth': depth, 'moves': len(times), 'nodes': nodes,
+          'nodesPerSecond': nodes / sum(times) if sum(times) > 0 else None,
+          'p50': percentile(times, 50), 'p95': percentile(times, 95),
+          'p99': percentile(times, 99), 'max': max(times) if times else None,
+          'actions': hashlib.md5(','.join(actions)).hexdigest(),
+          'peakKB': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}
+
+def runBenchmark( agents = AGENTS, layouts = LAYOUTS, ghosts = GHOSTS, depths = DEPTHS,
+                  positions = 20, seed = 0, warmup = 1, repetitions = 3, processes = 1 ):
+  """
+    Runs every agent on every layout, ghost count and depth.
+    Returns the list of the results of runCase().
+
+    @param processes the number of cases run at the same time, see
+    benchmarkUtils.runCases().
+  """
+  cases = []
+  for layoutName in layouts:
+    theLayout = layout.getLayout(layoutName)
+    if theLayout is None:
+      raise Exception("The layout " + layoutName + " cannot be found")
+    # A layout has at most getNumGhosts() ghosts.
+    for ghostCount in sorted(set(min(ghostCount, theLayout.getNumGhosts()) for ghostCount in ghosts)):
+      for depth in depths:
+        for agentName in agents:
+          cases.append((agentName, layoutName, ghostCount, depth, positions, seed, warmup, repetitions))
+  return runCases(runCase, cases, processes)
+
+def caseKey( result ):
+  return (result['agent'], result['layout'], result['ghosts'], result['depth'])
+
+def caseName( result ):
+  return '%s/%d ghosts/depth %d/%s' % (result['layout'], result['ghosts'], result['depth'], result['agent'])
+
+def checkCase( name, result, base ):
+  regressions = []
+  if result['actions'] != base['actions']:
+    regressions.append('%s: other moves chosen' % name)
+  if result['nodes'] > base['nodes']:
+    regressions.append('%s: nodes %d > %d' % (name, result['nodes'], base['nodes']))
+  return regressions
+
+def compare( results, baseline, tolerance = 0.2 ):
+  """
+    Returns the list of the regressions of results against the results of
+    a previous run: other moves chosen, more nodes searched, or a median
+    time more than tolerance above the baseline (and by more than 1 ms).
+  """
+  return compareResults(results, baseline, caseKey, caseName, checkCase, tolerance)
+
+def printTable( results, stream = sys.stdout ):
+  stream.write('%-16s %6s %5s %-16s %10s %10s %9s %9s %9s %9s %8s\n' %
+               ('layout', 'ghosts', 'depth', 'agent', 'nodes', 'nodes/s',
+                'p50 (s)', 'p95 (s)', 'p99 (s)', 'max (s)', 'peak KB'))
+  for result in results:
+    stream.write('%-16s %6d %5d %-16s %10d %10d %s %s %s %s %8d\n' %
+                 (result['layout'], result['ghosts'], result['depth'], result['agent'],
+                  result['nodes'], result['nodesPerSecond'] or 0,
+                  formatTime(result['p50']), formatTime(result['p95']),
+                  formatTime(result['p99']), formatTime(result['max']), result['peakKB']))
+
+def readCommand( argv ):
+  parser = OptionParser(usage = "python pacmanBenchmark.py [options]")
+  parser.add_option('-a', '--agents', dest = 'agents', default = ','.join(AGENTS), help = 'comma separated agents [default: %default]')
+  parser.add_option('-l', '--layouts', dest = 'layouts', default = ','.join(LAYOUTS), help = 'comma separated layouts [default: %default]')
+  parser.add_option('-g', '--ghosts', dest = 'ghosts', default = ','.join(map(str, GHOSTS)), help = 'comma separated ghost counts, at most those of the layout [default: %default]')
+  parser.add_option('-d', '--depths', dest = 'depths', default = ','.join(map(str, DEPTHS)), help = 'comma separated search depths [default: %default]')
+  parser.add_option('-n', '--positions', dest = 'positions', type = 'int', default = 20, help = 'positions per case [default: %default]')
+  parser.add_option('-s', '--seed', dest = 'seed', type = 'int', default = 0, help = 'seed of the positions and of the ties [default: %default]')
+  parser.add_option('-w', '--warmup', dest = 'warmup', type = 'int', default = 1, help = 'untimed passes over the positions [default: %default]')
+  parser.add_option('-r', '--repetitions', dest = 'repetitions', type = 'int', default = 3, help = 'timed passes over the positions [default: %default]')
+  parser.add_option('-j', '--processes', dest = 'processes', type = 'int', default = 1, help = 'cases run at the same time [default: %default]')
+  parser.add_option('--json', dest = 'json', default = None, help = 'write the results to this JSON file')
+  parser.add_option('--baseline', dest = 'baseline', default = None, help = 'JSON file of a previous run to compare with')
+  parser.add_option('--tolerance', dest = 'tolerance', type = 'float', default = 0.2, help = 'allowed relative slowdown of the median time [default: %default]')
+  options, otherjunk = parser.parse_args(argv)
+  if otherjunk:
+    raise Exception('Command line input not understood: ' + str(otherjunk))
+  return options
+
+if __name__ == '__main__':
+  options = readCommand(sys.argv[1:])
+  results = runBenchmark(options.agents.split(','), options.layouts.split(','),
+                         [int(ghosts) for ghosts in options.ghosts.split(',')],
+                         [int(depth) for depth in options.depths.split(',')],
+                         options.positions, options.seed, options.warmup,
+                         options.repetitions, options.processes)
+  printTable(results)
+  if options.json:
+    with open(options.json, 'w') as stream:
+      json.dump({'results': results}, stream, indent = 2, sort_keys = True)
+  if options.baseline:
+    with open(options.baseline) as stream:
+      regressions = compare(results, json.load(stream)['results'], options.tolerance)
+    for regression in regressions:
+      print 'REGRESSION ' + regression
+    if regressions:
+      sys.exit(1)
@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+#
+# ENSICAEN
+# École Nationale Supérieure d'Ingénieurs de Caen
+# 6 Boulevard Maréchal Juin
+# F-14050 Caen Cedex France
+#
+# Artificial Intelligence 2I1AE1
+#
+
+#
+# @file sudokuBenchmark.py
+#
+# Headless benchmark of the agents of agents2.py over the graded puzzle
+# sets of the puzzles/ directory (easy, medium, hard, pathological).
+#
+# Usage: python sudokuBenchmark.py -l easy,medium --json run.json
+#        python sudokuBenchmark.py --baseline run.json
+#
+
+import json
+import os
+import resource
+import sys
+from optparse import OptionParser
+
+import batchSolver
+from benchmarkUtils import percentile, formatTime, runCases, compareResults
+
+LEVELS = ['easy', 'medium', 'hard', 'pathological']
+HEURISTICS = ['defaultHeuristic', 'myHeuristic', 'mrvHeuristic']
+# BS, IncrementalBS and DLX do not take a heuristic function. AC3 is left
+# out: it only prunes the domains and solves nothing.
+AGENTS = [('BS', [None]), ('IncrementalBS', [None]),
+          ('FC', HEURISTICS), ('FC_CBJ', HEURISTICS), ('AC_FC', HEURISTICS), ('AC_AC', HEURISTICS),
+          ('DLX', [None])]
+PUZZLE_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'puzzles')
+
+def loadLevel( level ):
+    """ Returns the puzzles of a level of the corpus."""
+    return list(batchSolver.readPuzzles(os.path.join(PUZZLE_DIRECTORY, level + '.txt')))
+
+def runCase( case ):
+    """ Solves every puzzle of a level with one agent and heuristic.
+    Each puzzle is solved warmup times untimed, then repetitions times.
+    A puzzle that times out is not solved again."""
+    agentName, heuristicName, level, puzzles, warmup, repetitions, timeout = case
+    batchSolver._initWorker(agentName, heuristicName, timeout)
+    times, nodes, solved, timeouts, errors = [], 0, 0, 0, 0
+    for index, puzzle in enumerate(puzzles):
+        for run in range(warmup + repetitions):
+            result = batchSolver._solvePuzzle((index, puzzle))
+            if result.status in ('timeout', 'error'):
+                break
+            if run >= warmup:
+                times.append(result.stats['time'])
+        nodes += result.stats['nodes']
+        if result.status == 'timeout':
+            timeouts += 1
+        elif result.status == 'error':
+            errors += 1
+        elif result.status == 'solved':
+            solved += 1
+    return {'agent': agentName, 'heuristic': heuristicName, 'level': level,
+            'puzzles': len(puzzles), 'solved': solved, 'timeouts': timeouts, 'errors': errors,
+            'nodes': nodes, 'p50': percentile(times, 50), 'p90': percentile(times, 90),
+            'p99': percentile(times, 99), 'max': max(times) if times else None,
+            'peakKB': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}
+
+def runBenchmark( levels = LEVELS, agents = AGENTS, warmup = 1, repetitions = 3,
+                  timeout = 10.0, processes = 1 ):
+    """ Runs every agent and heuristic combination on every level.
+    Returns the list of the results of runCase().
+
+    @param agents a list of (agent name, list of heuristic names or [None]).
+    @param processes the number of cases run at the same time, see
+    benchmarkUtils.runCases()."""
+    cases = []
+    for level in levels:
+        puzzles = loadLevel(level)
+        for agentName, heuristicNames in agents:
+            for heuristicName in heuristicNames:
+                cases.append((agentName, heuristicName, level, puzzles, warmup, repetitions, timeout))
+    return runCases(runCase, cases, processes)
+
+def caseKey( result ):
+    return (result['agent'], result['heuristic'], result['level'])
+
+def caseName( result ):
+    return '%s/%s/%s' % (result['level'], result['agent'], result['heuristic'] or '-')
+
+def checkCase( name, result, base ):
+    regressions = []
+    if result['solved'] < base['solved']:
+        regressions.append('%s: solved %d < %d' % (name, result['solved'], base['solved']))
+    if result['nodes'] > base['nodes'] and result['timeouts'] == base['timeouts'] == 0:
+        regressions.append('%s: nodes %d > %d' % (name, result['nodes'], base['nodes']))
+    return regressions
+
+def compare( results, baseline, tolerance = 0.2 ):
+    """ Returns the list of the regressions of results against the results
+    of a previous run: fewer puzzles solved, more nodes expanded, or a median
+    time more than tolerance above the baseline (and by more than 1 ms)."""
+    return compareResults(results, baseline, caseKey, caseName, checkCase, tolerance)
+
+def printTable( results, stream = sys.stdout ):
+    stream.write('%-12s %-13s %-16s %7s %8s %10s %9s %9s %9s %9s %8s\n' %
+                 ('level', 'agent', 'heuristic', 'solved', 'timeouts', 'nodes',
+                  'p50 (s)', 'p90 (s)', 'p99 (s)', 'max (s)', 'peak KB'))
+    for result in results:
+        stream.write('%-12s %-13s %-16s %3d/%-3d %8d %10d %s %s %s %s %8d\n' %
+                     (result['level'], result['agent'], result['heuristic'] or '-',
+                      result['solved'], result['puzzles'], result['timeouts'], result['nodes'],
+                      formatTime(result['p50']), formatTime(result['p90']),
+                      formatTime(result['p99']), formatTime(result['max']), result['peakKB']))
+
+def readCommand( argv ):
+    parser = OptionParser(usage = "python sudokuBenchmark.py [options]")
+    parser.add_option('-l', '--levels', dest = 'levels', default = ','.join(LEVELS), help = 'comma separated levels [default: %default]')
+    parser.add_option('-a', '--agents', dest = 'agents', default = ','.join(name for name, heuristics in AGENTS), help = 'comma separated agents [default: %default]')
+    parser.add_option('-H', '--heuristics', dest = 'heuristics', default = ','.join(HEURISTICS), help = 'comma separated heuristics [default: %default]')
+    parser.add_option('-w', '--warmup', dest = 'warmup', type = 'int', default = 1, help = 'untimed solves per puzzle [default: %default]')
+    parser.add_option('-r', '--repetitions', dest = 'repetitions', type = 'int', default = 3, help = 'timed solves per puzzle [default: %default]')
+    parser.add_option('-t', '--timeout', dest = 'timeout', type = 'float', default = 10.0, help = 'time limit per solve in seconds [default: %default]')
+    parser.add_option('-j', '--processes', dest = 'processes', type = 'int', default = 1, help = 'cases run at the same time [default: %default]')
+    parser.add_option('--json', dest = 'json', default = None, help = 'write the results to this JSON file')
+    parser.add_option('--baseline', dest = 'baseline', default = None, help = 'JSON file of a previous run to compare with')
+    parser.add_option('--tolerance', dest = 'tolerance', type = 'float', default = 0.2, help = 'allowed relative slowdown of the median time [default: %default]')
+    options, otherjunk = parser.parse_args(argv)
+    if otherjunk:
+        raise Exception('Command line input not understood: ' + str(otherjunk))
+    return options
+
+if __name__ == '__main__':
+    options = readCommand(sys.argv[1:])
+    names = options.agents.split(',')
+    heuristics = options.heuristics.split(',')
+    agents = [(name, [heuristic for heuristic in candidates if heuristic is None or heuristic in heuristics])
+              for name, candidates in AGENTS if name in names]
+    results = runBenchmark(options.levels.split(','), agents, options.warmup,
+                           options.repetitions, options.timeout, options.processes)
+    printTable(results)
+    if options.json:
+        with open(options.json, 'w') as stream:
+            json.dump({'results': results}, stream, indent = 2, sort_keys = True)
+    if options.baseline:
+        with open(options.baseline) as stream:
+            regressions = compare(results, json.load(stream)['results'], options.tolerance)
+        for regression in regressions:
+            print 'REGRESSION ' + regression
+        if regressions:
+            sys.exit(1)
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+#
+# ENSICAEN
+# École Nationale Supérieure d'Ingénieurs de Caen
+# 6 Boulevard Maréchal Juin
+# F-14050 Caen Cedex France
+#
+# Artificial Intelligence 2I1AE1
+#
+
+#
+# @file test_agents3.py
+#
+# Regression checks of the search agents of agents3.py.
+#
+# Usage: python -m unittest test_agents3
+#
+
+import unittest
+
+import agents3
+
+class StubState:
+  """ A position with three legal actions for Pacman and one ghost. """
+  def getNumberOfAgents( self ):
+    return 2
+
+  def getLegalActions( self, agentIndex ):
+    return ['a0', 'a1', 'a2']
+
+class TimedOutAgent( agents3.SearchAgent ):
+  """
+    Agent whose first ply gives the values [1, 5, 3] to [a0, a1, a2] and
+    whose deeper searches all run out of time.
+  """
+  def rootValues( self, gameState, legalActions, depth ):
+    if depth > gameState.getNumberOfAgents():
+      raise agents3.SearchTimeout()
+    self.cutoff = True
+    values = {'a0': 1, 'a1': 5, 'a2': 3}
+    return [values[action] for action in legalActions]
+
+class IterativeDeepeningTest( unittest.TestCase ):
+
+  def testTimeoutPlaysBestActionOfCompletedDepth( self ):
+    agent = TimedOutAgent(depth = '4', ttSize = '0', timeLimit = '1')
+    state = StubState()
+    agent.registerInitialState(state)
+    self.assertEqual(agent.getAction(state), 'a1')
+    self.assertEqual(agent.completedDepth, state.getNumberOfAgents())
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+#
+# ENSICAEN
+# École Nationale Supérieure d'Ingénieurs de Caen
+# 6 Boulevard Maréchal Juin
+# F-14050 Caen Cedex France
+#
+# Artificial Intelligence 2I1AE1
+#
+
+#
+# @file test_benchmarkUtils.py
+#
+# Checks of the helpers shared by the benchmarks.
+#
+# Usage: python -m unittest test_benchmarkUtils
+#
+
+import unittest
+
+from benchmarkUtils import percentile
+
+class PercentileTest( unittest.TestCase ):
+
+  def testNearestRank( self ):
+    self.assertEqual(percentile(range(1, 11), 50), 5)
+    self.assertEqual(percentile([1, 2], 50), 1)
+    self.assertEqual(percentile(range(1, 21), 95), 19)
+    self.assertEqual(percentile(range(1, 21), 96), 20)
+    self.assertEqual(percentile([3, 1, 2], 50), 2)
+    self.assertEqual(percentile([7], 0), 7)
+    self.assertEqual(percentile([], 50), None)
+
+if __name__ == '__main__':
+  unittest.main()
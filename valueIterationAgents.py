@@ -14,6 +14,98 @@ import pdb
 
 from learningAgents import ValueEstimationAgent
 
+# NumPy is optional: without it, CompiledMDP runs its sweeps in Python.
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+class CompiledMDP:
+    """
+    An MDP compiled once for value iteration. The states are numbered and
+    every legal (state, action) pair is a row of a sparse transition
+    matrix, stored as coordinate arrays (row, column, probability). A
+    sweep is then the product of this matrix with the value vector
+    followed by a max over the rows of each state. With NumPy, it is a few
+    array operations; otherwise the same arrays are walked in Python,
+    which still avoids calling the mdp at every sweep.
+    """
+
+    def __init__(self, mdp, useNumpy = True):
+        self.states = mdp.getStates()
+        self.index = dict((state, i) for i, state in enumerate(self.states))
+        self.rewards = [mdp.getReward(state) for state in self.states]
+        # The rows of the state i are pairStart[i] to pairStart[i + 1] - 1.
+        self.pairStart = [0]
+        self.pairTransitions = []
+        for state in self.states:
+            for action in mdp.getPossibleActions(state):
+                self.pairTransitions.append([(self.index[nextState], prob)
+                                             for nextState, prob in mdp.getTransitionStatesAndProbs(state, action)])
+            self.pairStart.append(len(self.pairTransitions))
+        self.numpy = numpy if useNumpy else None
+        if self.numpy is not None:
+            rows, columns, probs = [], [], []
+            for pair, transitions in enumerate(self.pairTransitions):
+                for column, prob in transitions:
+                    rows.append(pair)
+                    columns.append(column)
+                    probs.append(prob)
+            self.rows = numpy.array(rows, dtype = numpy.intp)
+            self.columns = numpy.array(columns, dtype = numpy.intp)
+            self.probs = numpy.array(probs, dtype = float)
+            self.rewardVector = numpy.array(self.rewards, dtype = float)
+            starts = numpy.array(self.pairStart, dtype = numpy.intp)
+            # Only the states with actions have a max over their rows.
+            self.hasActions = starts[1:] > starts[:-1]
+            self.rowStarts = starts[:-1][self.hasActions]
+
+    def zeros(self):
+        if self.numpy is not None:
+            return numpy.zeros(len(self.states))
+        return [0.0] * len(self.states)
+
+    def sweep(self, values, discount):
+        """
+        Returns the values after one Bellman backup of all the states:
+        reward + discount * max over the actions of the expected values
+        (0 for a state without actions), and the largest change of a value.
+        """
+        if self.numpy is not None:
+            qValues = numpy.bincount(self.rows, weights = self.probs * values[self.columns],
+                                     minlength = len(self.pairTransitions))
+            best = numpy.zeros(len(self.states))
+            if len(self.rowStarts):
+                best[self.hasActions] = numpy.maximum.reduceat(qValues, self.rowStarts)
+            newValues = self.rewardVector + discount * best
+            residual = float(numpy.abs(newValues - values).max()) if len(values) else 0.0
+            return newValues, residual
+        newValues = [self.backup(values, i, discount) for i in range(len(self.states))]
+        residual = max([abs(new - old) for new, old in zip(newValues, values)] or [0.0])
+        return newValues, residual
+
+    def sweepInPlace(self, values, discount):
+        """
+        Gauss-Seidel sweep: backs up the states one after the other in the
+        list values, each backup using the values already updated by this
+        sweep. Returns the largest change of a value.
+        """
+        residual = 0.0
+        for i in range(len(self.states)):
+            value = self.backup(values, i, discount)
+            residual = max(residual, abs(value - values[i]))
+            values[i] = value
+        return residual
+
+    def backup(self, values, i, discount):
+        """ Returns the Bellman backup of the state i from values. """
+        best = None
+        for pair in range(self.pairStart[i], self.pairStart[i + 1]):
+            qValue = sum(prob * values[column] for column, prob in self.pairTransitions[pair])
+            if best is None or qValue > best:
+                best = qValue
+        return self.rewards[i] + discount * (best or 0)
+
 #  ______                   _            __ 
 # |  ____|                 (_)          /_ |
 # | |__  __  _____ _ __ ___ _ ___  ___   | |
@@ -27,9 +119,17 @@ class ValueIterationAgent(ValueEstimationAgent):
     (see mdp.py) on initialization and runs value iteration
     for a given number of iterations using the supplied
     discount factor.
+
+    Only the current values are kept. Value iteration stops as soon as
+    no value changes by more than tolerance in a sweep (with the default
+    tolerance of 0, once a sweep leaves every value unchanged), since
+    further sweeps give the same values; iterationsUsed is the number of
+    sweeps actually run. With inPlace, the sweeps are Gauss-Seidel
+    updates of a single buffer, which usually converge in fewer sweeps
+    (and run in Python even with NumPy).
     """
     
-    def __init__(self, mdp, discount = 0.9, iterations = 100):
+    def __init__(self, mdp, discount = 0.9, iterations = 100, tolerance = 0.0, inPlace = False):
         """
         Your value iteration agent should take an mdp on
         construction, run the indicated number of iterations
@@ -44,26 +144,30 @@ class ValueIterationAgent(ValueEstimationAgent):
         self.mdp = mdp
         self.discount = discount
         self.iterations = iterations
+        self.tolerance = tolerance
         self.values = util.Counter() # A Counter is a dict with default values as 0
         "*** YOUR CODE HERE ***"
-        states = mdp.getStates()
+        compiled = CompiledMDP(mdp, useNumpy = not inPlace)
+        values = compiled.zeros()
+        self.iterationsUsed = 0
+        self.residual = None
         for k in range(0, iterations):
-            for state in states:
-                actions = []
-                for action in mdp.getPossibleActions(state):
-                    trans_prob = mdp.getTransitionStatesAndProbs(state, action)
-                    actions.append(sum(self.values[tp[0], k-1] * tp[1] for tp in trans_prob))
-                if actions:
-                    max_prob = max(actions)
-                else:
-                    max_prob = 0
-                self.values[state, k] = mdp.getReward(state) + discount * max_prob  
+            if inPlace:
+                self.residual = compiled.sweepInPlace(values, discount)
+            else:
+                values, self.residual = compiled.sweep(values, discount)
+            self.iterationsUsed += 1
+            if self.residual <= tolerance:
+                break
+        if iterations > 0:
+            for i, state in enumerate(compiled.states):
+                self.values[state] = float(values[i])
 
     def getValue(self, state):
         """
         Returns the value of the state (computed in __init__).
         """
-        return self.values[state, self.iterations-1]
+        return self.values[state]
 
     def getPolicy(self, state):
         return self.computeActionFromValues(state)
@@ -92,10 +196,7 @@ class ValueIterationAgent(ValueEstimationAgent):
         max_prob = [] 
         for action in actions:
             trans_prob = self.mdp.getTransitionStatesAndProbs(state, action)
-            somme = 0
-            for tp in trans_prob:
-                somme += self.values[tp[0], self.iterations] * tp[1]
-            max_prob.append((sum(self.values[tp[0], self.iterations-1] * tp[1] for tp in trans_prob), action))
+            max_prob.append((sum(self.values[tp[0]] * tp[1] for tp in trans_prob), action))
         max_tuple = max(x for x in max_prob)
         return max_tuple[1]
        
@@ -108,4 +209,4 @@ class ValueIterationAgent(ValueEstimationAgent):
         if self.mdp.isTerminal(state):
             return self.mdp.getReward(state)
         trans_prob = self.mdp.getTransitionStatesAndProbs(state, action)
-        return sum(self.values[tp[0], self.iterations-1] * tp[1] for tp in trans_prob)
+        return sum(self.values[tp[0]] * tp[1] for tp in trans_prob)